@@ -11,6 +11,9 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+import os
+
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -49,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'habits.instrumentation.InstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -64,6 +68,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'habits.context_processors.assets',
             ],
         },
     },
@@ -75,13 +80,97 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
+# SQLite unless HABITS_DB_ENGINE=postgresql, in which case the connection is
+# read from the HABITS_DB_* environment variables. PostgreSQL connections are
+# kept open for HABITS_DB_CONN_MAX_AGE seconds, or drawn from a psycopg pool
+# when HABITS_DB_POOL_MAX_SIZE is set (needs `psycopg[pool]`). Set
+# HABITS_DB_DISABLE_SERVER_SIDE_CURSORS=1 behind a transaction-mode pgbouncer.
+
+DB_ENGINE = os.environ.get('HABITS_DB_ENGINE', 'sqlite')
+
+# WAL journaling, busy timeout and BEGIN IMMEDIATE for SQLite so concurrent
+# toggles wait for the write lock instead of failing (see habits/sqlite.py).
+HABITS_SQLITE_TUNING = os.environ.get('HABITS_SQLITE_TUNING', '1') == '1'
+HABITS_SQLITE_BUSY_TIMEOUT = int(os.environ.get('HABITS_SQLITE_BUSY_TIMEOUT', '5000'))  # ms
+HABITS_SQLITE_MMAP_SIZE = 128 * 1024 * 1024
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('HABITS_DB_NAME', 'habits'),
+            'USER': os.environ.get('HABITS_DB_USER', 'habits'),
+            'PASSWORD': os.environ.get('HABITS_DB_PASSWORD', ''),
+            'HOST': os.environ.get('HABITS_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('HABITS_DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('HABITS_DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('HABITS_DB_DISABLE_SERVER_SIDE_CURSORS') == '1',
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('HABITS_DB_POOL_MAX_SIZE'):
+        # the pool replaces persistent connections; Django refuses both at once
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('HABITS_DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ['HABITS_DB_POOL_MAX_SIZE']),
+            'timeout': float(os.environ.get('HABITS_DB_POOL_TIMEOUT', '10')),
+        }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('HABITS_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {},
+            # a file instead of Django's in-memory default, so tests can write
+            # from several threads at once the way concurrent requests do
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+    if HABITS_SQLITE_TUNING:
+        # take the write lock when a transaction starts (see habits/sqlite.py)
+        DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+    # SQLite builds the covering HabitEntry index without its INCLUDE column
+    SILENCED_SYSTEM_CHECKS = ['models.W040']
+else:
+    raise ImproperlyConfigured("HABITS_DB_ENGINE must be 'sqlite' or 'postgresql', not %r" % DB_ENGINE)
+
+# How habit completion history is stored (see habits/storage.py):
+# "rows" keeps one HabitEntry per habit per day, "bitset" keeps one
+# HabitMonth per habit per month. Switch with `manage.py convert_storage`.
+HABITS_STORAGE = 'rows'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# Cache used for the per-user API responses (see habits/caching.py) and how
+# long responses for the current month/year and for past months are kept.
+# The local-memory cache is per process: with several workers, point
+# HABITS_CACHE_ALIAS at a shared backend (Redis, Memcached) or a write in one
+# worker only reaches the others once their copies expire.
+HABITS_CACHE_ALIAS = 'default'
+HABITS_CACHE_TIMEOUT = 300
+HABITS_CACHE_PAST_TIMEOUT = 3600
+
+# Fraction of requests whose latency, query count/time and response size are
+# recorded by habits.instrumentation (exposed to staff at /metrics/).
+HABITS_METRICS_SAMPLE_RATE = 1.0
+
+# Pub/sub behind the live update stream at /api/events/ (see habits/events.py):
+# "local" only reaches clients connected to the same process; use a dotted
+# path to a shared broker class when running several ASGI workers. Idle
+# streams send a keepalive comment every HABITS_EVENTS_HEARTBEAT seconds.
+HABITS_EVENT_BROKER = 'local'
+HABITS_EVENTS_HEARTBEAT = 15
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -118,6 +207,18 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Serve the output of `manage.py build_assets`: precompiled JSX with React's
+# production builds, content-hashed file names (cached for a year) and
+# gzip/brotli copies. On by default whenever DEBUG is off.
+HABITS_BUILT_ASSETS = os.environ.get('HABITS_BUILT_ASSETS', '0' if DEBUG else '1') == '1'
+
+if HABITS_BUILT_ASSETS:
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'},
+    }
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -14,11 +14,17 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+from habits import assets
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("accounts/", include("accounts.urls")),  # now all auth URLs are prefixed
     path("", include("habits.urls")),
-]
\ No newline at end of file
+]
+
+if settings.HABITS_BUILT_ASSETS and not settings.DEBUG:
+    # precompressed, far-future cached static files (see habits/assets.py)
+    urlpatterns.insert(0, re_path(r"^%s(?P<path>.*)$" % settings.STATIC_URL.lstrip("/"), assets.serve))
@@ -19,3 +19,19 @@ from .models import JournalEntry
 class JournalEntryAdmin(admin.ModelAdmin):
 	list_display = ("user", "date")
 	search_fields = ("user__username",)
+
+from .models import HabitMonth
+
+
+@admin.register(HabitMonth)
+class HabitMonthAdmin(admin.ModelAdmin):
+	list_display = ("habit", "year", "month", "mask")
+	list_filter = ("year", "month")
+
+from .models import Tombstone
+
+
+@admin.register(Tombstone)
+class TombstoneAdmin(admin.ModelAdmin):
+	list_display = ("user", "kind", "key", "deleted_at")
+	list_filter = ("kind",)
@@ -0,0 +1,82 @@
+"""Month/year completion aggregates shared by the progress endpoints.
+
+Counts come from the precomputed rollup tables (see ``habits.rollups``): one
+query reads at most a month's worth of daily rows or a year's monthly rows,
+and days/months without a rollup are filled in Python.
+"""
+from .models import DailyRollup, Habit, MonthlyRollup
+import calendar
+import datetime as dt
+
+
+def _habit_count(user):
+    return Habit.objects.filter(user=user).count() or 0
+
+
+def _month_bounds(year, month):
+    _, ndays = calendar.monthrange(year, month)
+    return dt.date(year, month, 1), dt.date(year, month, ndays)
+
+
+def _month_body(year, month, total_habits, by_day):
+    _, ndays = calendar.monthrange(year, month)
+    days = []
+    counts = []
+    percentages = []
+    labels = []
+    for day in range(1, ndays + 1):
+        cnt = by_day.get(day, 0)
+        pct = round((cnt / total_habits * 100) if total_habits else 0, 1)
+        days.append(day)
+        counts.append(cnt)
+        percentages.append(pct)
+        labels.append(dt.date(year, month, day).isoformat())
+    return {"days": days, "counts": counts, "percentages": percentages, "labels": labels}
+
+
+def _year_body(year, total_habits, by_month):
+    monthly_counts = []
+    monthly_pct = []
+    labels = []
+    for month in range(1, 13):
+        _, ndays = calendar.monthrange(year, month)
+        cnt = by_month.get(month, 0)
+        pct = round((cnt / (total_habits * ndays) * 100) if total_habits else 0, 1)
+        monthly_counts.append(cnt)
+        monthly_pct.append(pct)
+        labels.append(f"{year}-{month:02d}")
+    return {"months": labels, "counts": monthly_counts, "percentages": monthly_pct}
+
+
+def month_progress(user, year, month):
+    """Per-day completed counts and percentages for one month."""
+    start, end = _month_bounds(year, month)
+    total_habits = _habit_count(user)
+    rows = DailyRollup.objects.filter(user=user, date__gte=start, date__lte=end)
+    by_day = {d.day: n for d, n in rows.values_list("date", "completed_count")}
+    return _month_body(year, month, total_habits, by_day)
+
+
+def year_progress(user, year):
+    """Per-month completed counts and percentages for one year."""
+    total_habits = _habit_count(user)
+    rows = MonthlyRollup.objects.filter(user=user, year=year)
+    by_month = dict(rows.values_list("month", "completed_count"))
+    return _year_body(year, total_habits, by_month)
+
+
+async def amonth_progress(user, year, month):
+    """Async :func:`month_progress`."""
+    start, end = _month_bounds(year, month)
+    total_habits = await Habit.objects.filter(user=user).acount()
+    rows = DailyRollup.objects.filter(user=user, date__gte=start, date__lte=end)
+    by_day = {d.day: n async for d, n in rows.values_list("date", "completed_count")}
+    return _month_body(year, month, total_habits, by_day)
+
+
+async def ayear_progress(user, year):
+    """Async :func:`year_progress`."""
+    total_habits = await Habit.objects.filter(user=user).acount()
+    rows = MonthlyRollup.objects.filter(user=user, year=year)
+    by_month = {m: n async for m, n in rows.values_list("month", "completed_count")}
+    return _year_body(year, total_habits, by_month)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class HabitsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'habits'
+
+    def ready(self):
+        from . import rollups, sqlite, tombstones
+        sqlite.connect()
+        rollups.connect()
+        tombstones.connect()
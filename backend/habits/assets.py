@@ -0,0 +1,102 @@
+"""Serving and precompression of the built static files.
+
+``build_assets`` collects static files through ``ManifestStaticFilesStorage``
+(content-hashed names) and writes ``.gz`` and, when the ``brotli`` package is
+installed, ``.br`` copies next to them. :func:`serve` answers static requests
+from ``STATIC_ROOT`` with the best precompressed variant the client accepts;
+hashed names never change content, so they are cached for a year.
+"""
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+import gzip
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:  # optional, gzip copies are always written
+    brotli = None
+
+COMPRESSIBLE = (".css", ".js", ".json", ".map", ".svg", ".txt", ".html")
+MIN_SIZE = 256
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+MUTABLE_MAX_AGE = 60
+
+# (suffix, Content-Encoding), in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def compress_file(path):
+    """Write ``path.gz`` (and ``path.br``) when they are smaller than ``path``."""
+    with open(path, "rb") as f:
+        data = f.read()
+    written = []
+    variants = [(".gz", lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", lambda: brotli.compress(data, quality=11)))
+    for suffix, compress in variants:
+        compressed = compress()
+        if len(compressed) < len(data):
+            with open(path + suffix, "wb") as f:
+                f.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+def compress_tree(root):
+    """Precompress every compressible file under ``root``; returns the files written."""
+    written = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if filename.endswith(COMPRESSIBLE) and os.path.getsize(path) >= MIN_SIZE:
+                written.extend(compress_file(path))
+    return written
+
+
+# (manifest mapping, set of its hashed names), rebuilt when the storage reloads
+_hashed_names = (None, frozenset())
+
+
+def _is_hashed(path):
+    global _hashed_names
+    hashed = getattr(staticfiles_storage, "hashed_files", None)
+    if not hashed:
+        return False
+    mapping, names = _hashed_names
+    if mapping is not hashed:
+        names = frozenset(hashed.values())
+        _hashed_names = (hashed, names)
+    return path in names
+
+
+def serve(request, path):
+    """Serve ``STATIC_ROOT/path``, preferring a precompressed variant."""
+    root = settings.STATIC_ROOT
+    try:
+        fullpath = safe_join(root, path)
+    except Exception:
+        raise Http404("Invalid path")
+    if not os.path.isfile(fullpath):
+        raise Http404("No such file")
+
+    accepted = request.META.get("HTTP_ACCEPT_ENCODING", "")
+    served, encoding = fullpath, None
+    for name, suffix in ENCODINGS:
+        if name in accepted and os.path.isfile(fullpath + suffix):
+            served, encoding = fullpath + suffix, name
+            break
+
+    content_type, _ = mimetypes.guess_type(fullpath)
+    response = FileResponse(open(served, "rb"), content_type=content_type or "application/octet-stream")
+    if encoding:
+        response["Content-Encoding"] = encoding
+    patch_vary_headers(response, ["Accept-Encoding"])
+    if _is_hashed(path):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=MUTABLE_MAX_AGE)
+    return response
@@ -0,0 +1,158 @@
+"""Async variants of the read-heavy habit APIs.
+
+These return the same bodies (and share the same response cache) as their
+counterparts in ``habits.views`` but use Django's async ORM, so under an
+ASGI server one worker can keep many dashboard requests in flight instead
+of parking a thread on each query. They are routed under ``api/async/``.
+``api_events`` is the server-sent events stream of :mod:`habits.events`.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from .models import JournalEntry
+from . import aggregation, caching, events, payloads
+from .views import _today_date, _wants_compact
+import asyncio
+import calendar
+import datetime as dt
+import json
+
+
+def _year_month(request, today):
+    try:
+        year = int(request.GET.get('year', today.year))
+        month = int(request.GET.get('month', today.month))
+    except (TypeError, ValueError):
+        year = today.year
+        month = today.month
+    return year, month
+
+
+@login_required
+async def monthly_progress(request):
+    user = await request.auser()
+    today = _today_date()
+    year, month = _year_month(request, today)
+    return await caching.ajson_response(
+        request, user, "monthly_progress", (year, month), caching.month_scopes(year, month, today),
+        lambda: aggregation.amonth_progress(user, year, month),
+    )
+
+
+@login_required
+async def yearly_progress(request):
+    user = await request.auser()
+    today = _today_date()
+    try:
+        year = int(request.GET.get('year', today.year))
+    except (TypeError, ValueError):
+        year = today.year
+    return await caching.ajson_response(
+        request, user, "yearly_progress", (year,), caching.year_scopes(year, today),
+        lambda: aggregation.ayear_progress(user, year),
+    )
+
+
+@login_required
+async def habits_for_month(request):
+    """Async ``views.habits_for_month``."""
+    user = await request.auser()
+    today = _today_date()
+    year, month = _year_month(request, today)
+    current = (year, month) == (today.year, today.month)
+    compact = _wants_compact(request)
+
+    async def build():
+        _, ndays = calendar.monthrange(year, month)
+        out = await payloads.amonth_payloads(user, year, month, today=today, with_streaks=current, compact=compact)
+        return {"habits": out, "ndays": ndays}
+
+    params = (year, month, today.isoformat()) if current else (year, month)
+    response = await caching.ajson_response(
+        request, user, "habits_for_month", params, caching.month_scopes(year, month, today), build, compact=compact
+    )
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+@login_required
+async def api_journal(request):
+    user = await request.auser()
+    if request.method == 'GET':
+        date_str = request.GET.get('date')
+        if date_str:
+            try:
+                d = dt.date.fromisoformat(date_str)
+            except Exception:
+                return JsonResponse({"error": "invalid date"}, status=400)
+        else:
+            d = _today_date()
+
+        async def build():
+            try:
+                entry = await JournalEntry.objects.aget(user=user, date=d)
+            except JournalEntry.DoesNotExist:
+                return {"date": d.isoformat(), "text": ""}
+            return {"date": d.isoformat(), "text": entry.text}
+
+        return await caching.ajson_response(request, user, "journal", (d.isoformat(),), (caching.JOURNAL,), build)
+
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body.decode())
+        except Exception:
+            data = request.POST or {}
+        date_str = data.get('date')
+        text = data.get('text', '')
+        if date_str:
+            try:
+                d = dt.date.fromisoformat(date_str)
+            except Exception:
+                return JsonResponse({"error": "invalid date"}, status=400)
+        else:
+            d = _today_date()
+        entry, created = await JournalEntry.objects.aupdate_or_create(user=user, date=d, defaults={"text": text})
+        await sync_to_async(caching.bump)(user.id, caching.JOURNAL)
+        await sync_to_async(events.publish)(user.id, "journal", events.client_id(request), date=d.isoformat())
+        return JsonResponse({"date": d.isoformat(), "text": entry.text})
+
+
+def _sse(event):
+    return "event: %s\ndata: %s\n\n" % (event["type"], json.dumps(event, separators=(",", ":")))
+
+
+@login_required
+async def api_events(request):
+    """Stream the user's change events as ``text/event-stream``.
+
+    Only served under ASGI: a WSGI worker would be held for the lifetime of
+    the connection, so there the response is ``204``, which tells
+    ``EventSource`` not to reconnect.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    user = await request.auser()
+    heartbeat = getattr(settings, "HABITS_EVENTS_HEARTBEAT", 15)
+
+    async def stream():
+        subscription = events.get_broker().subscribe(user.id)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), heartbeat)
+                except TimeoutError:
+                    # keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(event)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,106 @@
+"""Batched, resumable data backfills for large tables.
+
+:func:`backfill` applies one ``UPDATE`` per batch of primary keys instead of
+loading and saving rows one at a time, so a denormalization of
+``HabitEntry`` costs ``rows / batch_size`` statements and never holds locks
+on more than one batch. Use it from ``RunPython`` with the historical model::
+
+    def forwards(apps, schema_editor):
+        Entry = apps.get_model('habits', 'HabitEntry')
+        backfill(Entry, 'habitentry-foo', {'foo': F('bar')}, filter=Q(foo__isnull=True),
+                 using=schema_editor.connection.alias)
+
+In a migration declared ``atomic = False`` every batch commits on its own
+and the last finished primary key is checkpointed, so an interrupted run
+picks up where it stopped. Inside a transaction the batches still run as
+separate statements but only commit together.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max, Q
+import sys
+
+CHECKPOINT_TABLE = "habits_backfill_checkpoint"
+
+
+def _ensure_checkpoint_table(connection):
+    # plain SQL rather than a model: backfills run from migrations at any
+    # point in the history, before or after any model could have been added
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS %s (%s varchar(200) PRIMARY KEY, %s bigint NOT NULL)"
+            % (qn(CHECKPOINT_TABLE), qn("name"), qn("last_pk"))
+        )
+
+
+def _load_checkpoint(connection, name):
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT %s FROM %s WHERE %s = %%s" % (qn("last_pk"), qn(CHECKPOINT_TABLE), qn("name")), [name]
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _save_checkpoint(connection, name, last_pk):
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE %s SET %s = %%s WHERE %s = %%s" % (qn(CHECKPOINT_TABLE), qn("last_pk"), qn("name")),
+            [last_pk, name],
+        )
+        if cursor.rowcount == 0:
+            cursor.execute(
+                "INSERT INTO %s (%s, %s) VALUES (%%s, %%s)" % (qn(CHECKPOINT_TABLE), qn("name"), qn("last_pk")),
+                [name, last_pk],
+            )
+
+
+def _clear_checkpoint(connection, name):
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM %s WHERE %s = %%s" % (qn(CHECKPOINT_TABLE), qn("name")), [name])
+
+
+def _print_progress(name, updated, last_pk, max_pk):
+    sys.stdout.write("  %s: %d rows updated, pk %d of %d\n" % (name, updated, last_pk, max_pk))
+    sys.stdout.flush()
+
+
+def backfill(model, name, values, filter=None, batch_size=10000, using=DEFAULT_DB_ALIAS, report=_print_progress):
+    """Run ``model.objects.filter(filter).update(**values)`` in primary-key batches.
+
+    ``values`` may hold expressions (``F``, ``Subquery`` ...), which become
+    part of each batch's single ``UPDATE``. ``name`` identifies the
+    checkpoint; a run that finds one resumes after its primary key.
+    ``report(name, updated, last_pk, max_pk)`` is called after every batch
+    (pass ``None`` to stay quiet). Returns the number of rows updated.
+    """
+    connection = connections[using]
+    manager = model._default_manager.db_manager(using)
+    max_pk = manager.aggregate(m=Max("pk"))["m"]
+    if max_pk is None:
+        return 0
+
+    _ensure_checkpoint_table(connection)
+    last_pk = _load_checkpoint(connection, name)
+    keys = manager.order_by("pk").values_list("pk", flat=True)
+    updated = 0
+    while last_pk is None or last_pk < max_pk:
+        remaining = keys if last_pk is None else keys.filter(pk__gt=last_pk)
+        # keyset pagination: the batch ends at the batch_size-th remaining key
+        upper = remaining[batch_size - 1:batch_size].first()
+        if upper is None or upper > max_pk:
+            upper = max_pk
+        batch = manager.filter(pk__lte=upper)
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        with transaction.atomic(using=using):
+            updated += batch.filter(filter or Q()).update(**values)
+            _save_checkpoint(connection, name, upper)
+        last_pk = upper
+        if report is not None:
+            report(name, updated, last_pk, max_pk)
+    _clear_checkpoint(connection, name)
+    return updated
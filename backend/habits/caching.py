@@ -0,0 +1,192 @@
+"""Per-user response cache for the read-only JSON APIs.
+
+Cached bodies are keyed by user, request parameters and the current
+version of each piece of user data the response depends on:
+
+* ``entries`` - bumped when a habit entry is toggled,
+* ``habits`` - bumped when a habit is added or deleted,
+* ``journal`` - bumped when a journal entry is saved.
+
+Bumping a version makes every key built from the old one unreachable, so
+no explicit deletes are needed. Months before the current one cannot be
+edited ("Editing previous months is not allowed"), so their keys ignore
+``entries`` and are kept for ``HABITS_CACHE_PAST_TIMEOUT`` seconds instead
+of ``HABITS_CACHE_TIMEOUT``. Responses carry an ETag and conditional
+requests are answered with 304 Not Modified.
+
+Versions live in the cache itself, so a bump is only seen by processes
+sharing that cache. Several workers need a shared backend behind
+``HABITS_CACHE_ALIAS``; with a per-process one such as the default
+``LocMemCache``, the timeouts bound how long other workers serve stale
+bodies.
+
+Management commands that write user data directly should call
+:func:`bump_all` (or :func:`bump` for one user) afterwards.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+import hashlib
+import json
+import time
+
+try:
+    import orjson
+except ImportError:  # optional, only makes large bodies faster to encode
+    orjson = None
+
+ENTRIES = "entries"
+HABITS = "habits"
+JOURNAL = "journal"
+
+_GLOBAL = "habits:v:global"
+
+
+def _cache():
+    return caches[getattr(settings, "HABITS_CACHE_ALIAS", "default")]
+
+
+def _version_key(user_id, scope):
+    return f"habits:v:{user_id}:{scope}"
+
+
+def _fresh_version():
+    # start from the clock rather than 1 so an evicted counter never
+    # reuses a version that older cached bodies were stored under
+    return time.time_ns()
+
+
+def _versions(cache, user_id, scopes):
+    keys = [_GLOBAL] + [_version_key(user_id, s) for s in scopes]
+    found = cache.get_many(keys)
+    missing = {k: _fresh_version() for k in keys if k not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[k] for k in keys]
+
+
+async def _aversions(cache, user_id, scopes):
+    keys = [_GLOBAL] + [_version_key(user_id, s) for s in scopes]
+    found = await cache.aget_many(keys)
+    missing = {k: _fresh_version() for k in keys if k not in found}
+    if missing:
+        await cache.aset_many(missing, None)
+        found.update(missing)
+    return [found[k] for k in keys]
+
+
+def _incr(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _fresh_version(), None)
+
+
+def bump(user_id, *scopes):
+    """Invalidate the user's cached responses that depend on ``scopes``.
+
+    Runs after the surrounding transaction commits, so readers never cache
+    data from before the write under the new version.
+    """
+    def _bump():
+        cache = _cache()
+        for scope in scopes:
+            _incr(cache, _version_key(user_id, scope))
+    transaction.on_commit(_bump)
+
+
+def bump_all():
+    """Invalidate every cached response for every user."""
+    transaction.on_commit(lambda: _incr(_cache(), _GLOBAL))
+
+
+def month_scopes(year, month, today):
+    """Scopes a month-level response depends on, relative to ``today``."""
+    if (year, month) < (today.year, today.month):
+        return (HABITS,)
+    return (ENTRIES, HABITS)
+
+
+def year_scopes(year, today):
+    if year < today.year:
+        return (HABITS,)
+    return (ENTRIES, HABITS)
+
+
+def dumps(data, compact=False):
+    """Encode ``data`` to JSON bytes; ``compact`` drops optional whitespace.
+
+    Compact bodies use orjson when it is installed.
+    """
+    if not compact:
+        return json.dumps(data, cls=DjangoJSONEncoder).encode()
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+
+
+def _response_key(name, compact, user_id, params, versions):
+    return "habits:r:%s%s:%s:%s:%s" % (
+        name, ":c" if compact else "", user_id,
+        ":".join(str(p) for p in params), ":".join(str(v) for v in versions),
+    )
+
+
+def _encode(data, compact, scopes):
+    """Return ``(etag, body, timeout)`` for a freshly built response body."""
+    body = dumps(data, compact)
+    etag = quote_etag(hashlib.md5(body).hexdigest())
+    if ENTRIES in scopes or JOURNAL in scopes:
+        timeout = getattr(settings, "HABITS_CACHE_TIMEOUT", 300)
+    else:
+        timeout = getattr(settings, "HABITS_CACHE_PAST_TIMEOUT", 3600)
+    return etag, body, timeout
+
+
+def _respond(request, etag, body):
+    response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    # let the browser keep a copy but always revalidate it with the ETag
+    patch_cache_control(response, private=True, no_cache=True)
+    return get_conditional_response(request, etag=etag, response=response) or response
+
+
+def json_response(request, name, params, scopes, build, compact=False):
+    """Return ``build()`` as JSON, from cache when possible.
+
+    ``params`` are the request parameters the body depends on. Bodies that
+    do not depend on ``entries`` change rarely and are cached longer.
+    ``compact`` bodies are encoded without whitespace and cached separately.
+    """
+    cache = _cache()
+    user_id = request.user.id
+    key = _response_key(name, compact, user_id, params, _versions(cache, user_id, scopes))
+    cached = cache.get(key)
+    if cached is None:
+        etag, body, timeout = _encode(build(), compact, scopes)
+        cache.set(key, (etag, body), timeout)
+    else:
+        etag, body = cached
+    return _respond(request, etag, body)
+
+
+async def ajson_response(request, user, name, params, scopes, abuild, compact=False):
+    """Async :func:`json_response` for async views; ``abuild`` is a coroutine function.
+
+    ``user`` is passed in because ``request.user`` cannot be resolved from
+    async code. Keys and bodies are shared with the sync views.
+    """
+    cache = _cache()
+    key = _response_key(name, compact, user.id, params, await _aversions(cache, user.id, scopes))
+    cached = await cache.aget(key)
+    if cached is None:
+        etag, body, timeout = _encode(await abuild(), compact, scopes)
+        await cache.aset(key, (etag, body), timeout)
+    else:
+        etag, body = cached
+    return _respond(request, etag, body)
@@ -0,0 +1,6 @@
+from django.conf import settings
+
+
+def assets(request):
+    """Tell templates whether to load the built bundles or the JSX source."""
+    return {"built_assets": getattr(settings, "HABITS_BUILT_ASSETS", False)}
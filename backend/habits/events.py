@@ -0,0 +1,110 @@
+"""Per-user change events pushed to open pages over server-sent events.
+
+Write views call :func:`publish` with a small event (``entry``, ``habit`` or
+``journal``, or one ``entries`` event for a batch of toggles); the event
+reaches the broker once the surrounding transaction commits.
+``async_views.api_events`` subscribes the connected user and streams events
+as they arrive, so pages refresh on demand instead of polling.
+
+The broker is chosen with ``settings.HABITS_EVENT_BROKER``: ``"local"``
+(default) delivers events within the current process only, which is enough
+for a single ASGI worker and for tests. Deployments with several workers
+point the setting at the dotted path of a class with the same interface
+(``publish(user_id, event)`` and ``subscribe(user_id)`` returning an object
+with ``async get()`` and ``close()``), e.g. one backed by Redis pub/sub.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+import asyncio
+import functools
+import threading
+
+# events buffered per subscriber; a client that falls this far behind
+# misses events and catches up with its next full fetch
+QUEUE_SIZE = 100
+
+
+class LocalSubscription:
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def offer(self, event):
+        # runs on the subscriber's loop
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker._remove(self)
+
+
+class LocalBroker:
+    """In-process pub/sub; ``publish`` may be called from any thread."""
+
+    name = "local"
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Start buffering ``user_id``'s events; call from the consuming loop."""
+        subscription = LocalSubscription(self, user_id)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:  # the subscriber's loop is closed
+                subscription.close()
+
+    def subscriber_count(self, user_id):
+        with self._lock:
+            return len(self._subscriptions.get(user_id, ()))
+
+    def _remove(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+
+_BROKERS = {cls.name: cls for cls in (LocalBroker,)}
+
+
+@functools.cache
+def get_broker():
+    """Return the process-wide broker for ``HABITS_EVENT_BROKER``."""
+    name = getattr(settings, "HABITS_EVENT_BROKER", "local")
+    if name in _BROKERS:
+        return _BROKERS[name]()
+    try:
+        return import_string(name)()
+    except ImportError:
+        raise ValueError(f"Unknown HABITS_EVENT_BROKER {name!r}; expected one of {sorted(_BROKERS)} or a dotted path")
+
+
+def client_id(request):
+    """The ``X-Client-Id`` a page sends so that it can skip its own events."""
+    return request.headers.get("X-Client-Id")
+
+
+def publish(user_id, event_type, client=None, **data):
+    """Send ``{"type": event_type, ...data}`` to the user's open pages after commit."""
+    event = {"type": event_type, **data}
+    if client:
+        event["client"] = client
+    transaction.on_commit(lambda: get_broker().publish(user_id, event))
@@ -0,0 +1,58 @@
+"""Streaming export of habits, completion history and journal entries.
+
+Records are produced from server-side iterators (``.iterator(chunk_size)``)
+and encoded one at a time, so memory use does not depend on how much
+history is exported. Each record has a ``type`` of ``habit``, ``entry`` or
+``journal``; habits come first so importers can resolve ``habit_id``.
+"""
+from .models import Habit, JournalEntry
+from .storage import get_backend
+import csv
+import json
+
+FORMATS = ("ndjson", "csv")
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+CSV_FIELDS = ("type", "user_id", "habit_id", "title", "date", "completed", "text")
+
+
+def iter_records(user=None, year=None, chunk_size=2000):
+    """Yield export records for ``user`` (everyone when ``None``), optionally one year."""
+    habits = Habit.objects.order_by("user_id", "id")
+    journal = JournalEntry.objects.order_by("user_id", "date")
+    if user is not None:
+        habits = habits.filter(user=user)
+        journal = journal.filter(user=user)
+    if year is not None:
+        journal = journal.filter(date__year=year)
+
+    for habit_id, user_id, title in habits.values_list("id", "user_id", "title").iterator(chunk_size=chunk_size):
+        yield {"type": "habit", "user_id": user_id, "habit_id": habit_id, "title": title}
+    for user_id, habit_id, date, completed in get_backend().iter_entries(user, year, chunk_size=chunk_size):
+        yield {"type": "entry", "user_id": user_id, "habit_id": habit_id, "date": date.isoformat(), "completed": completed}
+    for user_id, date, text in journal.values_list("user_id", "date", "text").iterator(chunk_size=chunk_size):
+        yield {"type": "journal", "user_id": user_id, "date": date.isoformat(), "text": text}
+
+
+class _Echo:
+    """File-like object whose ``write`` returns the line instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def iter_ndjson(records):
+    for record in records:
+        yield json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def iter_csv(records):
+    writer = csv.DictWriter(_Echo(), fieldnames=CSV_FIELDS)
+    yield writer.writeheader()
+    for record in records:
+        yield writer.writerow(record)
+
+
+def iter_encoded(fmt, records):
+    if fmt == "csv":
+        return iter_csv(records)
+    return iter_ndjson(records)
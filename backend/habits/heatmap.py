@@ -0,0 +1,51 @@
+"""Compact per-day completion history for a whole year.
+
+Each habit's year is packed into one bitstring: bit ``n`` (least
+significant bit of byte ``n // 8`` first) is day-of-year ``n + 1``, so
+January 1st is bit 0. The bytes are base64 encoded, which takes 64
+characters for a whole year instead of 365 ``{"day": .., "completed": ..}``
+objects.
+"""
+from .models import Habit
+from .storage import get_backend
+import base64
+import calendar
+import datetime as dt
+
+ENCODING = "base64-bitset-lsb"
+
+
+def _month_offsets(year):
+    """Day-of-year index of the first day of each month."""
+    offsets = {}
+    offset = 0
+    for month in range(1, 13):
+        offsets[month] = offset
+        offset += calendar.monthrange(year, month)[1]
+    return offsets
+
+
+def encode_year(month_masks, year):
+    """Pack ``{month: mask}`` into a base64 day-of-year bitstring."""
+    offsets = _month_offsets(year)
+    bits = 0
+    for month, mask in month_masks.items():
+        bits |= mask << offsets[month]
+    ndays = 366 if calendar.isleap(year) else 365
+    return base64.b64encode(bits.to_bytes((ndays + 7) // 8, "little")).decode("ascii"), bits.bit_count()
+
+
+def year_heatmap(user, year):
+    habits = list(Habit.objects.filter(user=user).values_list("id", "title"))
+    masks = get_backend().year_masks(user, year, [hid for hid, _ in habits])
+    out = []
+    for habit_id, title in habits:
+        bits, completed_count = encode_year(masks[habit_id], year)
+        out.append({"id": habit_id, "title": title, "bits": bits, "completed_count": completed_count})
+    return {
+        "year": year,
+        "start": dt.date(year, 1, 1).isoformat(),
+        "days": 366 if calendar.isleap(year) else 365,
+        "encoding": ENCODING,
+        "habits": out,
+    }
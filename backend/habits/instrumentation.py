@@ -0,0 +1,192 @@
+"""Low-overhead per-view request metrics.
+
+``InstrumentationMiddleware`` records, for a sampled fraction of requests
+(``HABITS_METRICS_SAMPLE_RATE``), the view latency, the number and total
+time of database queries and the response size into in-process histograms.
+Nothing is written anywhere on the request path; ``metrics_view`` renders
+the histograms in the Prometheus text exposition format for staff users.
+
+Under ASGI, the async ORM runs a request's queries on the request's
+thread-sensitive worker thread, not on the event loop. The middleware
+therefore installs its query timer on that thread's connection. Each ASGI
+request gets its own such thread, so concurrent requests never share a
+timer.
+
+Histograms are per process, so with several workers each one reports its
+own numbers (scrape every worker, or aggregate in Prometheus).
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connection
+from django.http import HttpResponse
+import bisect
+import random
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with the same semantics as Prometheus'."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+METRICS = {
+    "habits_request_duration_seconds": ("View latency in seconds.", LATENCY_BUCKETS),
+    "habits_request_db_queries": ("Database queries per request.", QUERY_COUNT_BUCKETS),
+    "habits_request_db_duration_seconds": ("Time spent in database queries per request.", LATENCY_BUCKETS),
+    "habits_response_size_bytes": ("Response body size in bytes.", BYTES_BUCKETS),
+}
+
+_histograms = {}
+_registry_lock = threading.Lock()
+
+
+def observe(metric, view, value):
+    key = (metric, view)
+    hist = _histograms.get(key)
+    if hist is None:
+        with _registry_lock:
+            hist = _histograms.setdefault(key, Histogram(METRICS[metric][1]))
+    hist.observe(value)
+
+
+def reset():
+    with _registry_lock:
+        _histograms.clear()
+
+
+class _QueryTimer:
+    """``connection.execute_wrapper`` hook counting and timing queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def _install(timer):
+    # runs on the thread whose connection the request's queries will use
+    wrappers = connection.execute_wrappers
+    wrappers.append(timer)
+    return wrappers
+
+
+def _uninstall(wrappers, timer):
+    # by identity: overlapping requests sharing a thread may finish in any order
+    for i, wrapper in enumerate(wrappers):
+        if wrapper is timer:
+            del wrappers[i]
+            return
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # stay async under ASGI so async views are not forced onto a thread
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        rate = getattr(settings, "HABITS_METRICS_SAMPLE_RATE", 1.0)
+        return not (rate <= 0 or (rate < 1 and random.random() >= rate))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        timer = _QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        self._record(request, response, timer, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        timer = _QueryTimer()
+        start = time.perf_counter()
+        wrappers = await sync_to_async(_install)(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_uninstall)(wrappers, timer)
+        self._record(request, response, timer, time.perf_counter() - start)
+        return response
+
+    def _record(self, request, response, timer, elapsed):
+        match = getattr(request, "resolver_match", None)
+        view = (match.url_name or match.view_name) if match else "unmatched"
+        observe("habits_request_duration_seconds", view, elapsed)
+        observe("habits_request_db_queries", view, timer.count)
+        observe("habits_request_db_duration_seconds", view, timer.duration)
+        if not response.streaming:
+            observe("habits_response_size_bytes", view, len(response.content))
+
+
+def _format_le(bound):
+    return repr(float(bound)) if isinstance(bound, float) else str(bound)
+
+
+def render_prometheus():
+    lines = []
+    with _registry_lock:
+        items = sorted(_histograms.items())
+    by_metric = {}
+    for (metric, view), hist in items:
+        by_metric.setdefault(metric, []).append((view, hist))
+    for metric, (help_text, _) in METRICS.items():
+        if metric not in by_metric:
+            continue
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        for view, hist in by_metric[metric]:
+            counts, total, count = hist.snapshot()
+            cumulative = 0
+            for bound, n in zip(hist.buckets, counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{view="{view}",le="{_format_le(bound)}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{view="{view}",le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{view="{view}"}} {total}')
+            lines.append(f'{metric}_count{{view="{view}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+@staff_member_required
+def metrics_view(request):
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,268 @@
+"""Minimal JSX compiler used by the ``build_assets`` command.
+
+Turns JSX elements into ``React.createElement`` calls and leaves every
+other piece of JavaScript untouched, which is all the browser-side Babel
+transform did for ``static/js/frontend.jsx``. It understands elements,
+fragments, string/expression/boolean/spread attributes, expression
+children and JSX whitespace rules; it does not downlevel modern syntax.
+"""
+import html
+import json
+import re
+
+_NAME = re.compile(r"[A-Za-z_$][\w$.:-]*")
+_ATTR_NAME = re.compile(r"[A-Za-z_$][\w$:-]*")
+_IDENTIFIER = re.compile(r"^[A-Za-z_$][\w$]*$")
+_TRAILING_WORD = re.compile(r"[\w$]+$")
+_COMMENT = re.compile(r"/\*.*?\*/|//[^\n]*", re.S)
+# after these a `<` or `/` starts an expression (JSX or a regex), not an operator
+_EXPR_PUNCTUATION = set("(,=:?&|[{}!;~+-*%<>^")
+_EXPR_KEYWORDS = {"return", "case", "typeof", "void", "yield", "await", "in", "of", "new", "delete", "throw", "else", "do"}
+_REGEX_FLAGS = re.compile(r"[a-z]*\s*")
+
+
+class JSXSyntaxError(ValueError):
+    pass
+
+
+def compile_jsx(source):
+    """Return ``source`` with its JSX compiled to ``React.createElement`` calls."""
+    return _Compiler(source).compile()
+
+
+def _expression_position(out):
+    text = "".join(out).rstrip()
+    if not text:
+        return True
+    if text.endswith(("++", "--")):
+        # `i++ / 2`: a postfix operator ends an operand (a prefix one cannot precede `/` or `<`)
+        return False
+    if text[-1] in _EXPR_PUNCTUATION:
+        return True
+    word = _TRAILING_WORD.search(text)
+    return bool(word) and word.group() in _EXPR_KEYWORDS
+
+
+def _clean_text(text):
+    # Babel's rules: trim each line, drop whitespace-only lines, join the rest with a space
+    lines = text.replace("\r\n", "\n").replace("\t", " ").split("\n")
+    last_non_empty = max((i for i, line in enumerate(lines) if line.strip()), default=-1)
+    out = []
+    for i, line in enumerate(lines):
+        if i:
+            line = line.lstrip(" ")
+        if i < len(lines) - 1:
+            line = line.rstrip(" ")
+        if line:
+            out.append(line + (" " if i != last_non_empty else ""))
+    return html.unescape("".join(out))
+
+
+class _Compiler:
+    def __init__(self, src):
+        self.src = src
+        self.pos = 0
+
+    def error(self, message):
+        line = self.src.count("\n", 0, self.pos) + 1
+        return JSXSyntaxError("%s (line %d)" % (message, line))
+
+    def compile(self):
+        return self._js(until_brace=False)
+
+    def _copy_until(self, end, out):
+        stop = self.src.find(end, self.pos)
+        if stop < 0:
+            raise self.error("unterminated %r" % end)
+        stop += len(end)
+        out.append(self.src[self.pos:stop])
+        self.pos = stop
+
+    def _copy_quoted(self, quote, out):
+        start = self.pos
+        self.pos += 1
+        while self.pos < len(self.src):
+            c = self.src[self.pos]
+            if c == "\\":
+                self.pos += 2
+                continue
+            self.pos += 1
+            if c == quote:
+                out.append(self.src[start:self.pos])
+                return
+            if c == "[" and quote == "/":
+                # a `/` inside a regex character class does not end the regex
+                self._copy_quoted_class()
+        raise self.error("unterminated %s literal" % quote)
+
+    def _copy_regex(self, out):
+        self._copy_quoted("/", out)
+        flags = _REGEX_FLAGS.match(self.src, self.pos).end()
+        if self.src.startswith(">", flags):
+            # `/.../>` is how a misread `<tag/>` or `</tag>` ends; compiling on
+            # would leave the JSX in the output
+            raise self.error("JSX read as a regular expression; check the code before it")
+        out.append(self.src[self.pos:flags])
+        self.pos = flags
+
+    def _copy_quoted_class(self):
+        while self.pos < len(self.src) and self.src[self.pos] != "]":
+            self.pos += 2 if self.src[self.pos] == "\\" else 1
+        self.pos += 1
+
+    def _copy_template(self, out):
+        out.append("`")
+        self.pos += 1
+        while self.pos < len(self.src):
+            c = self.src[self.pos]
+            if c == "\\":
+                out.append(self.src[self.pos:self.pos + 2])
+                self.pos += 2
+            elif c == "`":
+                out.append("`")
+                self.pos += 1
+                return
+            elif self.src.startswith("${", self.pos):
+                self.pos += 2
+                out.append("${" + self._js(until_brace=True) + "}")
+            else:
+                out.append(c)
+                self.pos += 1
+        raise self.error("unterminated template literal")
+
+    def _js(self, until_brace):
+        """Copy JavaScript, compiling JSX, up to the end or the closing ``}``."""
+        out = []
+        depth = 0
+        src = self.src
+        while self.pos < len(src):
+            c = src[self.pos]
+            if src.startswith("//", self.pos):
+                self._copy_until("\n", out) if "\n" in src[self.pos:] else self._copy_rest(out)
+            elif src.startswith("/*", self.pos):
+                self._copy_until("*/", out)
+            elif c in "'\"":
+                self._copy_quoted(c, out)
+            elif c == "`":
+                self._copy_template(out)
+            elif c == "/" and _expression_position(out):
+                self._copy_regex(out)
+            elif c == "<" and _expression_position(out) and self._starts_element():
+                out.append(self._element())
+            elif c == "{":
+                depth += 1
+                out.append(c)
+                self.pos += 1
+            elif c == "}":
+                self.pos += 1
+                if depth == 0 and until_brace:
+                    return "".join(out)
+                depth -= 1
+                out.append(c)
+            else:
+                out.append(c)
+                self.pos += 1
+        if until_brace:
+            raise self.error("unbalanced {")
+        return "".join(out)
+
+    def _copy_rest(self, out):
+        out.append(self.src[self.pos:])
+        self.pos = len(self.src)
+
+    def _starts_element(self):
+        nxt = self.src[self.pos + 1:self.pos + 2]
+        return nxt == ">" or bool(nxt) and (nxt.isalpha() or nxt in "_$")
+
+    def _skip_space(self):
+        while self.pos < len(self.src) and self.src[self.pos].isspace():
+            self.pos += 1
+
+    def _read(self, pattern, what):
+        match = pattern.match(self.src, self.pos)
+        if not match:
+            raise self.error("expected %s" % what)
+        self.pos = match.end()
+        return match.group()
+
+    def _element(self):
+        self.pos += 1  # "<"
+        self._skip_space()
+        if self.src.startswith(">", self.pos):
+            self.pos += 1
+            return self._create("React.Fragment", [], self._children(""))
+
+        name = self._read(_NAME, "a tag name")
+        tag = json.dumps(name) if name[0].islower() and "." not in name else name
+        attrs = []
+        while True:
+            self._skip_space()
+            if self.src.startswith("/>", self.pos):
+                self.pos += 2
+                return self._create(tag, attrs, [])
+            if self.src.startswith(">", self.pos):
+                self.pos += 1
+                return self._create(tag, attrs, self._children(name))
+            if self.src.startswith("{", self.pos):
+                self.pos += 1
+                self._skip_space()
+                if not self.src.startswith("...", self.pos):
+                    raise self.error("expected a spread attribute")
+                self.pos += 3
+                attrs.append("..." + self._js(until_brace=True).strip())
+                continue
+            attr = self._read(_ATTR_NAME, "an attribute")
+            key = attr if _IDENTIFIER.match(attr) else json.dumps(attr)
+            self._skip_space()
+            if not self.src.startswith("=", self.pos):
+                attrs.append("%s: true" % key)
+                continue
+            self.pos += 1
+            self._skip_space()
+            c = self.src[self.pos:self.pos + 1]
+            if c in ("'", '"'):
+                end = self.src.find(c, self.pos + 1)
+                if end < 0:
+                    raise self.error("unterminated attribute value")
+                value = json.dumps(html.unescape(self.src[self.pos + 1:end]))
+                self.pos = end + 1
+            elif c == "{":
+                self.pos += 1
+                value = self._js(until_brace=True).strip()
+            elif c == "<":
+                value = self._element()
+            else:
+                raise self.error("expected an attribute value")
+            attrs.append("%s: %s" % (key, value))
+
+    def _children(self, name):
+        children = []
+        while self.pos < len(self.src):
+            if self.src.startswith("</", self.pos):
+                self.pos += 2
+                end = self.src.find(">", self.pos)
+                if end < 0 or self.src[self.pos:end].strip() != name:
+                    raise self.error("expected </%s>" % name)
+                self.pos = end + 1
+                return children
+            c = self.src[self.pos]
+            if c == "<":
+                children.append(self._element())
+            elif c == "{":
+                self.pos += 1
+                expr = self._js(until_brace=True)
+                if _COMMENT.sub("", expr).strip():
+                    children.append(expr.strip())
+            else:
+                start = self.pos
+                while self.pos < len(self.src) and self.src[self.pos] not in "<{":
+                    self.pos += 1
+                text = _clean_text(self.src[start:self.pos])
+                if text:
+                    children.append(json.dumps(text))
+        raise self.error("unclosed <%s>" % name)
+
+    @staticmethod
+    def _create(tag, attrs, children):
+        props = "{" + ", ".join(attrs) + "}" if attrs else "null"
+        return "React.createElement(%s)" % ", ".join([tag, props] + children)
@@ -0,0 +1,138 @@
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from habits.models import Habit
+import json
+import statistics
+import time
+
+# (users, habits per user, days of history)
+SIZES = {
+    "small": (5, 5, 90),
+    "medium": (20, 20, 365),
+    "large": (50, 50, 730),
+}
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed throwaway databases of several sizes, drive the habits APIs through the test "
+        "client and report latency percentiles and query counts per endpoint"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', choices=sorted(SIZES), default=['small', 'medium'])
+        parser.add_argument('--iterations', type=int, default=30, help='Requests per endpoint and size')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--baseline', help='Fail if any query count exceeds the counts in this JSON file')
+        parser.add_argument('--write-baseline', help='Write the measured query counts to this JSON file')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        results = {}
+        try:
+            for size in options['sizes']:
+                connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                try:
+                    results[size] = self._run_size(size, options['iterations'])
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            teardown_test_environment()
+
+        report = {
+            "generated_at": timezone.now().isoformat(),
+            "storage": getattr(settings, 'HABITS_STORAGE', 'rows'),
+            "iterations": options['iterations'],
+            "results": results,
+        }
+        for size, endpoints in results.items():
+            for name, r in endpoints.items():
+                self.stdout.write("%-6s %-24s p50=%7.2fms p90=%7.2fms p99=%7.2fms queries=%d" % (
+                    size, name, r['p50_ms'], r['p90_ms'], r['p99_ms'], r['queries']))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+        if options['write_baseline']:
+            counts = {size: {name: r['queries'] for name, r in endpoints.items()} for size, endpoints in results.items()}
+            with open(options['write_baseline'], 'w') as f:
+                json.dump(counts, f, indent=2, sort_keys=True)
+                f.write("\n")
+        if options['baseline']:
+            self._check_baseline(options['baseline'], results)
+
+    def _run_size(self, size, iterations):
+        users, habits, days = SIZES[size]
+        call_command('generate_load', users=users, habits=habits, days=days, seed=1, prefix='bench', stdout=self.stdout)
+        user = get_user_model().objects.get(username='bench-0@example.com')
+        habit = Habit.objects.filter(user=user).order_by('id').first()
+        client = Client()
+        client.force_login(user)
+        today = timezone.localdate()
+        state = {'completed': False}
+
+        def toggle():
+            state['completed'] = not state['completed']
+            return client.post('/api/toggle-entry/', {
+                'habit_id': habit.id, 'date': today.isoformat(), 'completed': str(state['completed']).lower(),
+            })
+
+        endpoints = {
+            'monthly_progress': lambda: client.get('/api/monthly-progress/'),
+            'yearly_progress': lambda: client.get('/api/yearly-progress/'),
+            'habits_for_month': lambda: client.get('/api/habits-for-month/'),
+            'api_toggle_entry': toggle,
+            'api_journal_get': lambda: client.get('/api/journal/'),
+            'api_journal_post': lambda: client.post(
+                '/api/journal/', json.dumps({'text': 'benchmark entry'}), content_type='application/json'),
+            'api_journal_month': lambda: client.get('/api/journal/month/'),
+        }
+        cache = caches[getattr(settings, 'HABITS_CACHE_ALIAS', 'default')]
+        out = {}
+        for name, call in endpoints.items():
+            samples = []
+            queries = 0
+            for _ in range(iterations):
+                # measure the uncached path; the response cache would hide regressions
+                cache.clear()
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    response = call()
+                    samples.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    raise CommandError("%s returned %d: %s" % (name, response.status_code, response.content[:200]))
+                queries = max(queries, len(ctx.captured_queries))
+            out[name] = {
+                'p50_ms': round(_percentile(samples, 50), 3),
+                'p90_ms': round(_percentile(samples, 90), 3),
+                'p99_ms': round(_percentile(samples, 99), 3),
+                'mean_ms': round(statistics.fmean(samples), 3),
+                'queries': queries,
+            }
+        return out
+
+    def _check_baseline(self, path, results):
+        with open(path) as f:
+            baseline = json.load(f)
+        regressions = []
+        for size, endpoints in results.items():
+            for name, r in endpoints.items():
+                allowed = baseline.get(size, {}).get(name)
+                if allowed is not None and r['queries'] > allowed:
+                    regressions.append("%s/%s: %d queries (baseline %d)" % (size, name, r['queries'], allowed))
+        if regressions:
+            raise CommandError("Query count regressions:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("Query counts within baseline %s" % path))
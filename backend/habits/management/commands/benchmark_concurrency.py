@@ -0,0 +1,118 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+import asyncio
+import threading
+import time
+
+from .benchmark_api import SIZES, _percentile
+
+# endpoint name -> (sync path, async path)
+ENDPOINTS = {
+    'monthly_progress': ('/api/monthly-progress/', '/api/async/monthly-progress/'),
+    'yearly_progress': ('/api/yearly-progress/', '/api/async/yearly-progress/'),
+    'habits_for_month': ('/api/habits-for-month/', '/api/async/habits-for-month/'),
+    'api_journal_get': ('/api/journal/', '/api/async/journal/'),
+}
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent-request throughput of the sync views (WSGI handler, one thread per "
+        "in-flight request) with their async variants (ASGI handler, one event loop)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=sorted(SIZES), default='small')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint, mode and concurrency')
+        parser.add_argument('--endpoints', nargs='+', choices=sorted(ENDPOINTS), default=sorted(ENDPOINTS))
+        parser.add_argument('--cached', action='store_true', help='Keep the response cache enabled')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        try:
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                if options['cached']:
+                    self._run(options)
+                else:
+                    # measure the views, not cache hits
+                    with override_settings(CACHES=NO_CACHE):
+                        self._run(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            teardown_test_environment()
+
+    def _run(self, options):
+        users, habits, days = SIZES[options['size']]
+        call_command('generate_load', users=users, habits=habits, days=days, seed=1, prefix='bench', stdout=self.stdout)
+        user = get_user_model().objects.get(username='bench-0@example.com')
+        client = Client()
+        client.force_login(user)
+        cookies = client.cookies
+
+        for name in options['endpoints']:
+            sync_path, async_path = ENDPOINTS[name]
+            for concurrency in options['concurrency']:
+                for mode, run in (('wsgi', self._run_sync), ('asgi', self._run_async)):
+                    path = sync_path if mode == 'wsgi' else async_path
+                    elapsed, samples = run(path, cookies, options['requests'], concurrency)
+                    self.stdout.write("%-18s %s c=%-4d %8.1f req/s  p50=%7.2fms p99=%7.2fms" % (
+                        name, mode, concurrency, len(samples) / elapsed,
+                        _percentile(samples, 50), _percentile(samples, 99),
+                    ))
+
+    def _run_sync(self, path, cookies, total, concurrency):
+        local = threading.local()
+
+        def one(_):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client()
+                client.cookies = cookies
+            start = time.perf_counter()
+            response = client.get(path)
+            took = (time.perf_counter() - start) * 1000
+            if response.status_code != 200:
+                raise CommandError("%s returned %d" % (path, response.status_code))
+            return took
+
+        def close(_):
+            connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            started = time.perf_counter()
+            samples = list(pool.map(one, range(total)))
+            elapsed = time.perf_counter() - started
+            list(pool.map(close, range(concurrency)))
+        return elapsed, samples
+
+    def _run_async(self, path, cookies, total, concurrency):
+        async def main():
+            client = AsyncClient()
+            client.cookies = cookies
+            gate = asyncio.Semaphore(concurrency)
+
+            async def one():
+                async with gate:
+                    start = time.perf_counter()
+                    response = await client.get(path)
+                    took = (time.perf_counter() - start) * 1000
+                if response.status_code != 200:
+                    raise CommandError("%s returned %d" % (path, response.status_code))
+                return took
+
+            started = time.perf_counter()
+            samples = await asyncio.gather(*(one() for _ in range(total)))
+            return time.perf_counter() - started, samples
+
+        return asyncio.run(main())
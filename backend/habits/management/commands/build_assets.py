@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from habits import assets
+from habits.jsx import JSXSyntaxError, compile_jsx
+import os
+
+# (source under STATICFILES_DIRS[0], compiled output)
+BUNDLES = (
+    ("js/frontend.jsx", "dist/frontend.js"),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompile the JSX frontend, collect static files with content-hashed names "
+        "and write gzip/brotli copies (no network access needed)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compile-only', action='store_true', help='Only compile the JSX bundles')
+
+    def handle(self, *args, **options):
+        source_root = settings.STATICFILES_DIRS[0]
+        for source, target in BUNDLES:
+            src = os.path.join(source_root, source)
+            dst = os.path.join(source_root, target)
+            with open(src, encoding='utf-8') as f:
+                try:
+                    compiled = compile_jsx(f.read())
+                except JSXSyntaxError as e:
+                    raise CommandError("%s: %s" % (source, e))
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            with open(dst, 'w', encoding='utf-8') as f:
+                f.write("// compiled from %s by `manage.py build_assets`; do not edit\n" % source)
+                f.write(compiled)
+            self.stdout.write("Compiled %s -> %s" % (source, target))
+        if options['compile_only']:
+            return
+
+        if not getattr(settings, 'HABITS_BUILT_ASSETS', False):
+            self.stderr.write(
+                "HABITS_BUILT_ASSETS is off: files are collected without hashed names "
+                "and the templates keep loading the JSX source"
+            )
+        call_command('collectstatic', interactive=False, verbosity=0)
+        written = assets.compress_tree(settings.STATIC_ROOT)
+        self.stdout.write(self.style.SUCCESS(
+            "Collected static files into %s and wrote %d compressed copies" % (settings.STATIC_ROOT, len(written))
+        ))
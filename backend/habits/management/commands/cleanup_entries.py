@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from habits.models import HabitEntry
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete HabitEntry rows with completed=False in batches; a missing entry already "
+        "means not completed, so they carry no information"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be deleted')
+
+    def handle(self, *args, **options):
+        redundant = HabitEntry.objects.filter(completed=False)
+        if options['dry_run']:
+            self.stdout.write('%d redundant entries' % redundant.count())
+            return
+
+        deleted = 0
+        last_pk = 0
+        while True:
+            # walk the primary key so every batch is a short, indexed delete in its own transaction
+            pks = list(
+                redundant.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:options['batch_size']]
+            )
+            if not pks:
+                break
+            deleted += HabitEntry.objects.filter(pk__in=pks, completed=False).delete()[0]
+            last_pk = pks[-1]
+            self.stdout.write('Deleted %d entries' % deleted)
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS('Removed %d redundant entries' % deleted))
@@ -0,0 +1,113 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from habits import caching, rollups, streaks, tombstones
+from habits.models import HabitEntry, HabitMonth, Tombstone
+from habits.storage import day_bit, mask_days
+import datetime as dt
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy habit completion history between HabitEntry rows and HabitMonth bitsets, "
+        "making the target an exact copy of the source"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', choices=['bitset', 'rows'], default='bitset', help='Target storage mode')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--delete-source', action='store_true', help='Delete the source rows once copied')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            if options['to'] == 'bitset':
+                written, cleared = self._to_bitset(batch_size)
+            else:
+                written, cleared = self._to_rows(batch_size)
+            # source and target hold the same days now, so the configured
+            # (source) storage gives the right counts and streaks for both
+            rollups.rebuild()
+            streaks.rebuild()
+            if options['delete_source']:
+                (HabitEntry if options['to'] == 'bitset' else HabitMonth).objects.all().delete()
+            caching.bump_all()
+        self.stdout.write(self.style.SUCCESS(
+            "Wrote %d and cleared %d %s rows; rebuilt rollups and streaks. Set HABITS_STORAGE = '%s' to use them."
+            % (written, cleared, options['to'], options['to'])
+        ))
+
+    def _to_bitset(self, batch_size):
+        masks = {}
+        entries = (
+            HabitEntry.objects.filter(completed=True)
+            .order_by('habit_id', 'date')
+            .values_list('habit_id', 'user_id', 'date')
+        )
+        for habit_id, user_id, date in entries.iterator(chunk_size=batch_size):
+            key = (habit_id, user_id, date.year, date.month)
+            masks[key] = masks.get(key, 0) | day_bit(date.day)
+        rows = [
+            HabitMonth(habit_id=habit_id, user_id=user_id, year=year, month=month, mask=mask)
+            for (habit_id, user_id, year, month), mask in masks.items()
+        ]
+        HabitMonth.objects.bulk_create(
+            rows, batch_size=batch_size,
+            update_conflicts=True, unique_fields=['habit', 'year', 'month'], update_fields=['mask', 'updated_at'],
+        )
+        # months the source has no completed day for; the rows stay (with an
+        # empty mask) so that syncing clients see the days as unchecked
+        stale = [
+            pk for pk, habit_id, user_id, year, month in HabitMonth.objects.exclude(mask=0)
+            .values_list('pk', 'habit_id', 'user_id', 'year', 'month').iterator(chunk_size=batch_size)
+            if (habit_id, user_id, year, month) not in masks
+        ]
+        now = timezone.now()
+        for i in range(0, len(stale), batch_size):
+            HabitMonth.objects.filter(pk__in=stale[i:i + batch_size]).update(mask=0, updated_at=now)
+        return len(rows), len(stale)
+
+    def _to_rows(self, batch_size):
+        written = 0
+        kept = set()
+        batch = []
+        months = HabitMonth.objects.exclude(mask=0).values_list('habit_id', 'user_id', 'year', 'month', 'mask')
+        for habit_id, user_id, year, month, mask in months.iterator(chunk_size=batch_size):
+            for day in mask_days(mask):
+                date = dt.date(year, month, day)
+                kept.add((habit_id, date))
+                batch.append(HabitEntry(habit_id=habit_id, user_id=user_id, date=date, completed=True))
+            if len(batch) >= batch_size:
+                written += self._flush_rows(batch, batch_size)
+                batch = []
+        written += self._flush_rows(batch, batch_size)
+
+        # rows the source does not have as completed: un-completed in rows
+        # storage means no row, plus a tombstone for syncing clients
+        stale = {}
+        for pk, habit_id, user_id, date, completed in HabitEntry.objects.values_list(
+            'pk', 'habit_id', 'user_id', 'date', 'completed'
+        ).iterator(chunk_size=batch_size):
+            if (habit_id, date) not in kept:
+                stale.setdefault(user_id, []).append((pk, tombstones.entry_key(habit_id, date) if completed else None))
+        cleared = 0
+        for user_id, rows in stale.items():
+            for i in range(0, len(rows), batch_size):
+                chunk = rows[i:i + batch_size]
+                HabitEntry.objects.filter(pk__in=[pk for pk, _ in chunk]).delete()
+                tombstones.record(user_id, Tombstone.ENTRY, [key for _, key in chunk if key])
+            cleared += len(rows)
+        return written, cleared
+
+    def _flush_rows(self, batch, batch_size):
+        HabitEntry.objects.bulk_create(
+            batch, batch_size=batch_size,
+            update_conflicts=True, unique_fields=['habit', 'date'], update_fields=['completed', 'updated_at'],
+        )
+        # the days exist again; drop tombstones left by earlier un-completes
+        keys = {}
+        for entry in batch:
+            keys.setdefault(entry.user_id, []).append(tombstones.entry_key(entry.habit_id, entry.date))
+        for user_id, user_keys in keys.items():
+            tombstones.clear(user_id, Tombstone.ENTRY, user_keys)
+        return len(batch)
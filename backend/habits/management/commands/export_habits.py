@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from habits import export
+
+
+class Command(BaseCommand):
+    help = "Stream habits, completion history and journal entries as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to export (default: every user)')
+        parser.add_argument('--year', type=int, help='Only export entries and journal for this year')
+        parser.add_argument('--format', choices=export.FORMATS, default='ndjson')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            User = get_user_model()
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError('No user named %s' % options['user'])
+
+        records = export.iter_records(user, options['year'], chunk_size=options['chunk_size'])
+        chunks = export.iter_encoded(options['format'], records)
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                f.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
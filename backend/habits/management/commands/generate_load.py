@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from habits.models import DailyRollup, Habit, HabitEntry, HabitMonth, HabitStats, MonthlyRollup
+from habits import caching
+from habits.storage import day_bit
+import datetime as dt
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = "Generate N users x M habits x D days of synthetic history with bulk inserts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--habits', type=int, default=5, help='Habits per user')
+        parser.add_argument('--days', type=int, default=365, help='Days of history ending at --end')
+        parser.add_argument('--end', type=dt.date.fromisoformat, help='Last day of history (default: today)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; same seed, same data')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='load', help='Username prefix for generated users')
+        parser.add_argument('--password', default='load-password', help='Password set on every generated user')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        db = options['database']
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        end = options['end'] or timezone.localdate()
+        start = end - dt.timedelta(days=options['days'] - 1)
+        prefix = options['prefix']
+        bitset = getattr(settings, 'HABITS_STORAGE', 'rows') == 'bitset'
+
+        usernames = [f"{prefix}-{i}@example.com" for i in range(options['users'])]
+        if User.objects.using(db).filter(username__in=usernames).exists():
+            raise CommandError("Users named %s-*@example.com already exist; use another --prefix" % prefix)
+
+        started = time.monotonic()
+        written = 0
+        with transaction.atomic(using=db):
+            # hashing is deliberately slow, so every user shares one hash
+            password = make_password(options['password'])
+            User.objects.using(db).bulk_create(
+                [User(username=u, email=u, password=password) for u in usernames], batch_size=batch_size
+            )
+            users = list(User.objects.using(db).filter(username__in=usernames).order_by('id'))
+            Habit.objects.using(db).bulk_create(
+                [Habit(user=u, title=f"Habit {j + 1}") for u in users for j in range(options['habits'])],
+                batch_size=batch_size,
+            )
+            habits = list(Habit.objects.using(db).filter(user__in=users).order_by('id'))
+
+            daily = {}
+            monthly = {}
+            batch = []
+            masks = {}
+            stats = []
+            for habit in habits:
+                # each habit gets its own base rate, with weekdays more likely than weekends
+                rate = rng.uniform(0.3, 0.9)
+                longest, run_end, run_length, earlier = 0, None, 0, 0
+                day = start
+                while day <= end:
+                    completed = rng.random() < (rate if day.weekday() < 5 else rate - 0.2)
+                    if completed:
+                        if run_end == day - dt.timedelta(days=1):
+                            run_length += 1
+                        else:
+                            earlier = max(earlier, run_length)
+                            run_length = 1
+                        run_end = day
+                        longest = max(longest, run_length)
+                        daily[(habit.user_id, day)] = daily.get((habit.user_id, day), 0) + 1
+                        mkey = (habit.user_id, day.year, day.month)
+                        monthly[mkey] = monthly.get(mkey, 0) + 1
+                    if bitset:
+                        if completed:
+                            key = (habit.id, habit.user_id, day.year, day.month)
+                            masks[key] = masks.get(key, 0) | day_bit(day.day)
+                    elif completed:
+                        batch.append(HabitEntry(habit_id=habit.id, user_id=habit.user_id, date=day, completed=True))
+                        if len(batch) >= batch_size:
+                            HabitEntry.objects.using(db).bulk_create(batch, batch_size=batch_size)
+                            written += len(batch)
+                            batch = []
+                    day += dt.timedelta(days=1)
+                stats.append(HabitStats(
+                    habit=habit, longest_streak=longest, last_run_end=run_end, last_run_length=run_length,
+                    longest_earlier=earlier,
+                ))
+            if batch:
+                HabitEntry.objects.using(db).bulk_create(batch, batch_size=batch_size)
+                written += len(batch)
+            if masks:
+                HabitMonth.objects.using(db).bulk_create(
+                    [HabitMonth(habit_id=h, user_id=u, year=y, month=m, mask=mask) for (h, u, y, m), mask in masks.items()],
+                    batch_size=batch_size,
+                )
+                written += len(masks)
+
+            DailyRollup.objects.using(db).bulk_create(
+                [DailyRollup(user_id=u, date=d, completed_count=n) for (u, d), n in daily.items()],
+                batch_size=batch_size,
+            )
+            MonthlyRollup.objects.using(db).bulk_create(
+                [MonthlyRollup(user_id=u, year=y, month=m, completed_count=n) for (u, y, m), n in monthly.items()],
+                batch_size=batch_size,
+            )
+            HabitStats.objects.using(db).bulk_create(stats, batch_size=batch_size)
+            caching.bump_all()
+
+        self.stdout.write(self.style.SUCCESS(
+            "Created %d users, %d habits and %d %s rows (%s to %s) in %.1fs" % (
+                len(users), len(habits), written, 'HabitMonth' if bitset else 'HabitEntry',
+                start, end, time.monotonic() - started,
+            )
+        ))
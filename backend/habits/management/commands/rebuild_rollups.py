@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from habits import caching, rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily/monthly completion rollups from HabitEntry and check they match"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild rollups for this username')
+        parser.add_argument('--verify-only', action='store_true', help='Report mismatches without rebuilding')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            User = get_user_model()
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError('No user named %s' % options['user'])
+
+        if not options['verify_only']:
+            with transaction.atomic():
+                ndaily, nmonthly = rollups.rebuild(user)
+                caching.bump_all()
+            self.stdout.write('Rebuilt %d daily and %d monthly rollups' % (ndaily, nmonthly))
+
+        problems = rollups.verify(user)
+        for kind, key, expected, actual in problems[:20]:
+            self.stdout.write('%s %s: expected %d, found %d' % (kind, key, expected, actual))
+        if problems:
+            raise CommandError('%d rollup rows are inconsistent' % len(problems))
+        self.stdout.write(self.style.SUCCESS('Rollups are consistent'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from habits import caching, streaks
+
+
+class Command(BaseCommand):
+    help = "Recompute current/longest streak stats for every habit from its completion history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild streaks for this username')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            User = get_user_model()
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError('No user named %s' % options['user'])
+        with transaction.atomic():
+            count = streaks.rebuild(user)
+            caching.bump_all()
+        self.stdout.write(self.style.SUCCESS('Rebuilt streaks for %d habits' % count))
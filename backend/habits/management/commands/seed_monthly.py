@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from habits.models import Habit, HabitEntry
+from habits import caching, rollups, streaks
 from django.utils import timezone
 import datetime as dt
 import random
@@ -34,7 +35,15 @@ class Command(BaseCommand):
             for h in habits:
                 # random completion with weekly pattern bias
                 completed = random.random() < (0.5 + (0.2 if day.weekday() < 5 else -0.1))
-                HabitEntry.objects.update_or_create(habit=h, date=day, defaults={"completed": completed})
+                if completed:
+                    HabitEntry.objects.update_or_create(habit=h, date=day, defaults={"completed": True})
+                else:
+                    HabitEntry.objects.filter(habit=h, date=day).delete()
             day += dt.timedelta(days=1)
 
+        # entries were written directly, so refresh the progress rollups
+        rollups.rebuild(user)
+        streaks.rebuild(user)
+        caching.bump_all()
+
         self.stdout.write(self.style.SUCCESS('Seeded sample habits and entries for user: %s' % user.username))
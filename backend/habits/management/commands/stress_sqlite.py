@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connections
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.utils import timezone
+from habits import rollups
+from habits.models import Habit
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+MODES = {'default': '0', 'tuned': '1'}
+# every JOURNAL_EVERY-th request of a thread saves a journal entry instead of
+# toggling: update_or_create reads before it writes, which is what makes
+# deferred transactions fail with "database is locked" under contention
+JOURNAL_EVERY = 4
+
+
+def run_toggles(user, habit_ids, threads, toggles, seed=0):
+    """Post ``toggles`` random toggles of this month's days from each of ``threads`` threads.
+
+    Every ``JOURNAL_EVERY``-th request saves a journal entry instead. Returns ``(counts, latencies_ms, seconds)``; ``counts`` has ``ok``,
+    ``lock_errors`` and ``other_errors``. Every thread closes its database
+    connections when done.
+    """
+    login = Client()
+    login.force_login(user)
+    today = timezone.localdate()
+    days = [today.replace(day=d) for d in range(1, today.day + 1)]
+
+    counts = {'ok': 0, 'lock_errors': 0, 'other_errors': 0}
+    samples = []
+    lock = threading.Lock()
+
+    def worker(n):
+        rng = random.Random(seed + n)
+        client = Client()
+        client.cookies = login.cookies
+        for i in range(toggles):
+            start = time.perf_counter()
+            try:
+                if i % JOURNAL_EVERY == JOURNAL_EVERY - 1:
+                    response = client.post('/api/journal/', json.dumps({
+                        'date': rng.choice(days).isoformat(), 'text': 'stress %d' % rng.random(),
+                    }), content_type='application/json')
+                else:
+                    response = client.post('/api/toggle-entry/', {
+                        'habit_id': rng.choice(habit_ids), 'date': rng.choice(days).isoformat(),
+                        'completed': rng.choice(['true', 'false']),
+                    })
+                outcome = 'ok' if response.status_code == 200 else 'other_errors'
+                if response.status_code == 500:
+                    # the view reports write failures (here: lock timeouts) as 500
+                    outcome = 'lock_errors'
+            except OperationalError:
+                outcome = 'lock_errors'
+            took = (time.perf_counter() - start) * 1000
+            with lock:
+                counts[outcome] += 1
+                samples.append(took)
+        connections.close_all()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(threads)))
+    return counts, samples, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Toggle habit entries from many threads at once against a scratch SQLite file, "
+        "with and without HABITS_SQLITE_TUNING, and report lock errors and throughput"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--toggles', type=int, default=50, help='Toggles per thread')
+        parser.add_argument('--habits', type=int, default=10)
+        parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=['default', 'tuned'])
+        # internal: run one mode in this process against the configured database
+        parser.add_argument('--worker', action='store_true', help='Run one stress pass in-process')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.stdout.write(json.dumps(self._stress(options)))
+            return
+
+        for mode in options['modes']:
+            with tempfile.TemporaryDirectory() as tmp:
+                # each mode gets its own process so the settings (and connections) are fresh
+                env = dict(os.environ, HABITS_DB_ENGINE='sqlite', HABITS_DB_NAME=os.path.join(tmp, 'stress.sqlite3'),
+                           HABITS_SQLITE_TUNING=MODES[mode])
+                proc = subprocess.run(
+                    [sys.executable, '-m', 'django', 'stress_sqlite', '--worker',
+                     '--threads', str(options['threads']), '--toggles', str(options['toggles']),
+                     '--habits', str(options['habits'])],
+                    cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+                )
+            if proc.returncode:
+                raise CommandError("%s pass failed:\n%s" % (mode, proc.stderr))
+            r = json.loads(proc.stdout.strip().splitlines()[-1])
+            self.stdout.write(
+                "%-8s ok=%-6d lock_errors=%-6d other_errors=%-4d %8.1f toggles/s  p99=%7.1fms  rollup_mismatches=%d" % (
+                    mode, r['ok'], r['lock_errors'], r['other_errors'], r['ok'] / r['seconds'], r['p99_ms'],
+                    r['rollup_mismatches'],
+                )
+            )
+
+    def _stress(self, options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError("stress_sqlite only runs against SQLite")
+        setup_test_environment()
+        call_command('migrate', verbosity=0)
+        call_command('generate_load', users=1, habits=options['habits'], days=60, seed=1,
+                     prefix='stress', stdout=io.StringIO())
+        user = get_user_model().objects.get(username='stress-0@example.com')
+        habit_ids = list(Habit.objects.filter(user=user).values_list('id', flat=True))
+        counts, samples, seconds = run_toggles(user, habit_ids, options['threads'], options['toggles'])
+        samples.sort()
+        return dict(
+            counts, seconds=seconds, p99_ms=samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+            rollup_mismatches=len(rollups.verify(user)),
+        )
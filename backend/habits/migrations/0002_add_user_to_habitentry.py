@@ -1,17 +1,37 @@
 from django.db import migrations, models
+from django.db.models import OuterRef, Q, Subquery
+
+from habits.backfill import backfill
+
+
+def add_user_column(apps, schema_editor):
+    # the migration is not atomic, so a run interrupted during the backfill
+    # has already added the column; only add it when it is missing
+    HabitEntry = apps.get_model('habits', 'HabitEntry')
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        columns = {c.name for c in connection.introspection.get_table_description(cursor, HabitEntry._meta.db_table)}
+    field = HabitEntry._meta.get_field('user')
+    if field.column not in columns:
+        schema_editor.add_field(HabitEntry, field)
+
+
+def drop_user_column(apps, schema_editor):
+    HabitEntry = apps.get_model('habits', 'HabitEntry')
+    schema_editor.remove_field(HabitEntry, HabitEntry._meta.get_field('user'))
 
 
 def forwards(apps, schema_editor):
     HabitEntry = apps.get_model('habits', 'HabitEntry')
     Habit = apps.get_model('habits', 'Habit')
-    # Backfill user_id from habit.user_id
-    for entry in HabitEntry.objects.select_related('habit').all():
-        try:
-            entry.user_id = entry.habit.user_id
-            entry.save(update_fields=['user'])
-        except Exception:
-            # skip problematic rows
-            continue
+    # Backfill user_id from habit.user_id, one UPDATE per batch of entries
+    backfill(
+        HabitEntry,
+        'habitentry-user',
+        {'user_id': Subquery(Habit.objects.filter(pk=OuterRef('habit_id')).values('user_id')[:1])},
+        filter=Q(user__isnull=True),
+        using=schema_editor.connection.alias,
+    )
 
 
 def backwards(apps, schema_editor):
@@ -20,17 +40,24 @@ def backwards(apps, schema_editor):
 
 
 class Migration(migrations.Migration):
+    # let every backfill batch commit on its own so the backfill can resume
+    atomic = False
 
     dependencies = [
         ('habits', '0001_initial'),
     ]
 
     operations = [
-        migrations.AddField(
-            model_name='habitentry',
-            name='user',
-            field=models.ForeignKey(null=True, editable=False, on_delete=models.CASCADE, to='auth.user'),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='habitentry',
+                    name='user',
+                    field=models.ForeignKey(null=True, editable=False, on_delete=models.CASCADE, to='auth.user'),
+                ),
+            ],
         ),
+        migrations.RunPython(add_user_column, drop_user_column),
         migrations.RunPython(forwards, backwards),
         migrations.AlterField(
             model_name='habitentry',
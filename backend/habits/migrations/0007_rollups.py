@@ -0,0 +1,60 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def populate(apps, schema_editor):
+    HabitEntry = apps.get_model('habits', 'HabitEntry')
+    DailyRollup = apps.get_model('habits', 'DailyRollup')
+    MonthlyRollup = apps.get_model('habits', 'MonthlyRollup')
+    completed = HabitEntry.objects.filter(completed=True).order_by()
+    DailyRollup.objects.bulk_create(
+        [DailyRollup(user_id=r['user_id'], date=r['date'], completed_count=r['n'])
+         for r in completed.values('user_id', 'date').annotate(n=Count('id'))],
+        batch_size=1000,
+    )
+    monthly = completed.annotate(y=ExtractYear('date'), m=ExtractMonth('date')).values('user_id', 'y', 'm')
+    MonthlyRollup.objects.bulk_create(
+        [MonthlyRollup(user_id=r['user_id'], year=r['y'], month=r['m'], completed_count=r['n'])
+         for r in monthly.annotate(n=Count('id'))],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0006_habitentry_habits_habi_user_id_281a80_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('completed_count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('month', models.IntegerField()),
+                ('completed_count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'year', 'month')},
+            },
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+import datetime as dt
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _completed_dates(apps, habit_id):
+    if getattr(settings, 'HABITS_STORAGE', 'rows') == 'bitset':
+        HabitMonth = apps.get_model('habits', 'HabitMonth')
+        for year, month, mask in HabitMonth.objects.filter(habit_id=habit_id).order_by('year', 'month').values_list('year', 'month', 'mask'):
+            for day in range(1, 32):
+                if mask & (1 << (day - 1)):
+                    yield dt.date(year, month, day)
+    else:
+        HabitEntry = apps.get_model('habits', 'HabitEntry')
+        yield from HabitEntry.objects.filter(habit_id=habit_id, completed=True).order_by('date').values_list('date', flat=True).iterator()
+
+
+def populate(apps, schema_editor):
+    Habit = apps.get_model('habits', 'Habit')
+    HabitStats = apps.get_model('habits', 'HabitStats')
+    stats = []
+    for habit_id in Habit.objects.values_list('id', flat=True).iterator():
+        longest, run_end, run_length = 0, None, 0
+        for date in _completed_dates(apps, habit_id):
+            run_length = run_length + 1 if run_end is not None and (date - run_end).days == 1 else 1
+            run_end = date
+            longest = max(longest, run_length)
+        stats.append(HabitStats(habit_id=habit_id, longest_streak=longest, last_run_end=run_end, last_run_length=run_length))
+    HabitStats.objects.bulk_create(stats, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0008_habitmonth'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitStats',
+            fields=[
+                ('habit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='habits.habit')),
+                ('longest_streak', models.IntegerField(default=0)),
+                ('last_run_end', models.DateField(blank=True, null=True)),
+                ('last_run_length', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0009_habitstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # build the replacements before dropping the old indexes
+        migrations.AddIndex(
+            model_name='habitentry',
+            index=models.Index(fields=['habit', 'date'], include=('completed',), name='habitentry_habit_date_cov'),
+        ),
+        migrations.AddIndex(
+            model_name='habitentry',
+            index=models.Index(condition=models.Q(('completed', True)), fields=['user', 'date'], name='habitentry_user_date_done'),
+        ),
+        migrations.RemoveIndex(
+            model_name='habitentry',
+            name='habits_habi_habit_i_3299af_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='habitentry',
+            name='habits_habi_user_id_281a80_idx',
+        ),
+    ]
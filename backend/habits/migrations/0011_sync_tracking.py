@@ -0,0 +1,74 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0010_habitentry_access_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=16)),
+                ('key', models.CharField(max_length=64)),
+                ('deleted_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='habitentry',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='habitmonth',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='journalentry',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['user', 'updated_at'], name='habits_habi_user_id_bbc18b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habitentry',
+            index=models.Index(fields=['user', 'updated_at'], name='habits_habi_user_id_d9aa0c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habitmonth',
+            index=models.Index(fields=['user', 'updated_at'], name='habits_habi_user_id_5d7c33_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='journalentry',
+            index=models.Index(fields=['user', 'updated_at'], name='habits_jour_user_id_77cde9_idx'),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['user', 'deleted_at'], name='habits_tomb_user_id_14d642_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='tombstone',
+            unique_together={('user', 'kind', 'key')},
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from habits import search
+
+
+def install(apps, schema_editor):
+    search.install(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0011_sync_tracking'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,48 @@
+import datetime as dt
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _completed_dates(apps, habit_id):
+    if getattr(settings, 'HABITS_STORAGE', 'rows') == 'bitset':
+        HabitMonth = apps.get_model('habits', 'HabitMonth')
+        for year, month, mask in HabitMonth.objects.filter(habit_id=habit_id).order_by('year', 'month').values_list('year', 'month', 'mask'):
+            for day in range(1, 32):
+                if mask & (1 << (day - 1)):
+                    yield dt.date(year, month, day)
+    else:
+        HabitEntry = apps.get_model('habits', 'HabitEntry')
+        yield from HabitEntry.objects.filter(habit_id=habit_id, completed=True).order_by('date').values_list('date', flat=True).iterator()
+
+
+def populate(apps, schema_editor):
+    HabitStats = apps.get_model('habits', 'HabitStats')
+    stats = []
+    for habit_id in HabitStats.objects.values_list('habit_id', flat=True).iterator():
+        earlier, run_end, run_length = 0, None, 0
+        for date in _completed_dates(apps, habit_id):
+            if run_end is not None and (date - run_end).days == 1:
+                run_length += 1
+            else:
+                earlier = max(earlier, run_length)
+                run_length = 1
+            run_end = date
+        stats.append(HabitStats(habit_id=habit_id, longest_earlier=earlier))
+    HabitStats.objects.bulk_update(stats, ['longest_earlier'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0012_journal_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habitstats',
+            name='longest_earlier',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -7,30 +7,39 @@ from django.utils import timezone
 class Habit(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
+    # bumped on every save; the sync API pages through changes by (updated_at, id)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.title
     class Meta:
-        indexes = [models.Index(fields=["user"])]
+        indexes = [models.Index(fields=["user"]), models.Index(fields=["user", "updated_at"])]
 
 
 class HabitEntry(models.Model):
     """Represents a single habit's completion state for a particular date.
 
     We keep per-day entries so we can aggregate month-wise and year-wise.
+    Only completed days are stored; a missing entry means "not completed".
     """
     habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name="entries")
     # Denormalized user to avoid JOINs when querying by user (speeds up large-scale aggregations)
     user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=True, editable=False)
     date = models.DateField()
     completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("habit", "date")
         ordering = ["-date"]
         indexes = [
-            models.Index(fields=["habit", "date"]),
-            models.Index(fields=["user", "date", "completed"]),
+            # month payloads read every entry of a few habits over a date range;
+            # INCLUDE lets PostgreSQL answer them from the index alone
+            # (SQLite has no covering indexes and builds a plain one)
+            models.Index(fields=["habit", "date"], include=["completed"], name="habitentry_habit_date_cov"),
+            # per-user counts only ever look at completed entries
+            models.Index(fields=["user", "date"], condition=models.Q(completed=True), name="habitentry_user_date_done"),
+            models.Index(fields=["user", "updated_at"]),
         ]
 
     def __str__(self):
@@ -51,10 +60,111 @@ class JournalEntry(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     date = models.DateField()
     text = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("user", "date")
-        indexes = [models.Index(fields=["user", "date"])]
+        indexes = [models.Index(fields=["user", "date"]), models.Index(fields=["user", "updated_at"])]
 
     def __str__(self):
         return f"Journal {self.user.username} @ {self.date}"
+
+
+class DailyRollup(models.Model):
+    """Number of completed habit entries for a user on one date.
+
+    Maintained incrementally by the toggle views; rebuild with the
+    `rebuild_rollups` management command after out-of-band edits.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    completed_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("user", "date")
+
+    def __str__(self):
+        return f"{self.user_id} @ {self.date}: {self.completed_count}"
+
+
+class MonthlyRollup(models.Model):
+    """Number of completed habit entries for a user in one calendar month."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    year = models.IntegerField()
+    month = models.IntegerField()
+    completed_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("user", "year", "month")
+
+    def __str__(self):
+        return f"{self.user_id} @ {self.year}-{self.month:02d}: {self.completed_count}"
+
+
+class HabitMonth(models.Model):
+    """Compact completion history: one row per habit per calendar month.
+
+    Bit ``day - 1`` of ``mask`` is set when the habit was completed on that
+    day. Used instead of ``HabitEntry`` when ``HABITS_STORAGE = "bitset"``.
+    """
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name="months")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, editable=False)
+    year = models.IntegerField()
+    month = models.IntegerField()
+    mask = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("habit", "year", "month")
+        indexes = [models.Index(fields=["user", "year", "month"]), models.Index(fields=["user", "updated_at"])]
+
+    def __str__(self):
+        return f"{self.habit.title} @ {self.year}-{self.month:02d} -> {self.mask:031b}"
+
+
+class HabitStats(models.Model):
+    """Denormalized streak statistics for one habit.
+
+    Only the most recent run of consecutive completed days, the longest run
+    before it and the overall longest run are stored; see ``habits.streaks``
+    for how they are maintained.
+    """
+    habit = models.OneToOneField(Habit, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    longest_streak = models.IntegerField(default=0)
+    last_run_end = models.DateField(null=True, blank=True)
+    last_run_length = models.IntegerField(default=0)
+    # longest run that ended before the most recent one started
+    longest_earlier = models.IntegerField(default=0)
+
+    def current_streak(self, today):
+        """Length of the run ending today or yesterday (still extendable), else 0."""
+        if self.last_run_end is None or (today - self.last_run_end).days > 1:
+            return 0
+        return self.last_run_length
+
+    def __str__(self):
+        return f"{self.habit_id}: longest {self.longest_streak}, last run {self.last_run_length}"
+
+
+class Tombstone(models.Model):
+    """Marks a deleted habit, entry or journal entry for the sync API.
+
+    ``key`` identifies the deleted record within ``kind``: the habit id, or
+    ``"<habit_id>:<date>"`` for an entry. An entry's tombstone is removed
+    again when the entry is re-created.
+    """
+    HABIT = "habit"
+    ENTRY = "entry"
+    JOURNAL = "journal"
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=16)
+    key = models.CharField(max_length=64)
+    deleted_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("user", "kind", "key")
+        indexes = [models.Index(fields=["user", "deleted_at"])]
+
+    def __str__(self):
+        return f"{self.user_id} {self.kind} {self.key} deleted @ {self.deleted_at}"
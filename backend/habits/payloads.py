@@ -0,0 +1,80 @@
+"""Per-habit month payloads shared by the habit list and toggle APIs.
+
+Completion for all requested habits is read in one query through the
+storage helpers (see ``habits.storage``) as month masks, and the per-day
+arrays are assembled in memory, so the query count does not depend on how
+many habits a user has.
+"""
+from django.utils import timezone
+
+from .models import Habit
+from .storage import day_bit, get_backend
+from . import streaks
+import calendar
+
+
+def _habit_payload(habit, mask, ndays, compact=False):
+    mask &= (1 << ndays) - 1
+    completed_count = mask.bit_count()
+    pct = round((completed_count / ndays * 100), 1) if ndays else 0
+    if compact:
+        # bit `day - 1` set when completed; clients expand it themselves
+        return {
+            "id": habit.id,
+            "title": habit.title,
+            "mask": mask,
+            "completed_count": completed_count,
+            "percentage": pct
+        }
+    days = [{"day": d, "completed": bool(mask & day_bit(d))} for d in range(1, ndays + 1)]
+    return {
+        "id": habit.id,
+        "title": habit.title,
+        "days": days,
+        "completed_count": completed_count,
+        "percentage": pct
+    }
+
+
+def month_payloads(user, year, month, habits=None, today=None, with_streaks=False, compact=False):
+    """Build the month payload for each of ``habits`` (default: all of the user's).
+
+    ``with_streaks`` adds each habit's current and longest streak, read from
+    the stored ``HabitStats`` (one extra query). ``compact`` replaces the
+    per-day ``days`` list with a ``mask`` integer (bit ``day - 1`` set when
+    completed).
+    """
+    _, ndays = calendar.monthrange(year, month)
+    if habits is None:
+        habits = Habit.objects.filter(user=user)
+    habits = list(habits)
+    if not habits:
+        return []
+
+    masks = get_backend().month_masks(user, year, month, [h.id for h in habits])
+    out = [_habit_payload(h, masks[h.id], ndays, compact) for h in habits]
+    if with_streaks:
+        _add_streaks(out, streaks.stats_for([h.id for h in habits]), today)
+    return out
+
+
+async def amonth_payloads(user, year, month, today=None, with_streaks=False, compact=False):
+    """Async :func:`month_payloads` for all of the user's habits."""
+    _, ndays = calendar.monthrange(year, month)
+    habits = [h async for h in Habit.objects.filter(user=user)]
+    if not habits:
+        return []
+
+    masks = await get_backend().amonth_masks(user, year, month, [h.id for h in habits])
+    out = [_habit_payload(h, masks[h.id], ndays, compact) for h in habits]
+    if with_streaks:
+        _add_streaks(out, await streaks.astats_for([h.id for h in habits]), today)
+    return out
+
+
+def _add_streaks(out, stats, today):
+    on = today or timezone.localdate()
+    for payload in out:
+        s = stats.get(payload["id"])
+        payload["current_streak"] = s.current_streak(on) if s else 0
+        payload["longest_streak"] = s.longest_streak if s else 0
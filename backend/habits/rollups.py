@@ -0,0 +1,142 @@
+"""Incrementally maintained completion counts per user and day/month.
+
+The toggle views call :func:`record_change` inside the same transaction as
+the entry write, so the rollups never drift from the stored entries for changes
+made through the app. Deleting a habit (from the admin or by cascade)
+subtracts its completed days before they go, see :func:`remove_habit`.
+:func:`rebuild` and :func:`verify` back the `rebuild_rollups` management
+command for everything else.
+"""
+from django.contrib.auth.models import User
+from django.db.models import Case, F, Q, QuerySet, Value, When
+from django.db.models.signals import pre_delete
+
+from . import caching
+from .models import DailyRollup, Habit, MonthlyRollup
+from .storage import get_backend
+
+
+def _increment(model, lookup, delta):
+    updated = model.objects.filter(**lookup).update(completed_count=F("completed_count") + delta)
+    if not updated:
+        # first completion for this period; another writer may race us to the row
+        model.objects.bulk_create([model(completed_count=0, **lookup)], ignore_conflicts=True)
+        model.objects.filter(**lookup).update(completed_count=F("completed_count") + delta)
+
+
+def record_change(user_id, date, was_completed, completed):
+    """Apply the effect of one entry going from ``was_completed`` to ``completed``."""
+    delta = int(bool(completed)) - int(bool(was_completed))
+    if not delta:
+        return
+    _increment(DailyRollup, {"user_id": user_id, "date": date}, delta)
+    _increment(MonthlyRollup, {"user_id": user_id, "year": date.year, "month": date.month}, delta)
+
+
+def _increment_many(model, user_id, deltas):
+    """Like :func:`_increment` for ``{lookup_tuple: delta}`` in two statements."""
+    fields = ("date",) if model is DailyRollup else ("year", "month")
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    model.objects.bulk_create(
+        [model(user_id=user_id, completed_count=0, **dict(zip(fields, key))) for key in deltas],
+        ignore_conflicts=True,
+    )
+    whens = [When(then=Value(delta), **dict(zip(fields, key))) for key, delta in deltas.items()]
+    match = Q()
+    for key in deltas:
+        match |= Q(**dict(zip(fields, key)))
+    model.objects.filter(match, user_id=user_id).update(
+        completed_count=F("completed_count") + Case(*whens, default=Value(0))
+    )
+
+
+def record_changes(user_id, changes):
+    """Apply many ``{(habit_id, date): (was_completed, completed)}`` changes.
+
+    Deltas are summed per date and month first and written with one
+    ``CASE`` update per rollup table, however many dates are touched.
+    """
+    daily = {}
+    monthly = {}
+    for (_, date), (was_completed, completed) in changes.items():
+        delta = int(bool(completed)) - int(bool(was_completed))
+        daily[(date,)] = daily.get((date,), 0) + delta
+        monthly[(date.year, date.month)] = monthly.get((date.year, date.month), 0) + delta
+    _increment_many(DailyRollup, user_id, daily)
+    _increment_many(MonthlyRollup, user_id, monthly)
+
+
+def remove_habit(user_id, habit_id, chunk_size=500):
+    """Subtract the completed days of a habit that is about to be deleted."""
+    dates = list(get_backend().iter_completed_dates(habit_id))
+    # each date loses exactly one completion; chunked to keep the IN lists short
+    for i in range(0, len(dates), chunk_size):
+        DailyRollup.objects.filter(user_id=user_id, date__in=dates[i:i + chunk_size]).update(
+            completed_count=F("completed_count") - 1
+        )
+    monthly = {}
+    for date in dates:
+        monthly[(date.year, date.month)] = monthly.get((date.year, date.month), 0) - 1
+    _increment_many(MonthlyRollup, user_id, monthly)
+
+
+def _habit_deleting(sender, instance, origin=None, **kwargs):
+    # a deleted user takes its rollups along; nothing to subtract
+    if (origin.model if isinstance(origin, QuerySet) else type(origin)) is User:
+        return
+    # runs before the cascade removes the habit's entries, in the same transaction
+    remove_habit(instance.user_id, instance.pk)
+    caching.bump(instance.user_id, caching.HABITS)
+
+
+def connect():
+    pre_delete.connect(_habit_deleting, sender=Habit, dispatch_uid="habits.rollups.habit")
+
+
+def _actual(user=None):
+    daily_qs = DailyRollup.objects.exclude(completed_count=0)
+    monthly_qs = MonthlyRollup.objects.exclude(completed_count=0)
+    if user is not None:
+        daily_qs = daily_qs.filter(user=user)
+        monthly_qs = monthly_qs.filter(user=user)
+    daily = {(u, d): n for u, d, n in daily_qs.values_list("user_id", "date", "completed_count")}
+    monthly = {(u, y, m): n for u, y, m, n in monthly_qs.values_list("user_id", "year", "month", "completed_count")}
+    return daily, monthly
+
+
+def rebuild(user=None, batch_size=1000):
+    """Recompute the rollups from stored entries (for one user, or everyone)."""
+    daily, monthly = get_backend().completion_counts(user)
+    daily_qs = DailyRollup.objects.all()
+    monthly_qs = MonthlyRollup.objects.all()
+    if user is not None:
+        daily_qs = daily_qs.filter(user=user)
+        monthly_qs = monthly_qs.filter(user=user)
+    daily_qs.delete()
+    monthly_qs.delete()
+    DailyRollup.objects.bulk_create(
+        [DailyRollup(user_id=u, date=d, completed_count=n) for (u, d), n in daily.items()],
+        batch_size=batch_size,
+    )
+    MonthlyRollup.objects.bulk_create(
+        [MonthlyRollup(user_id=u, year=y, month=m, completed_count=n) for (u, y, m), n in monthly.items()],
+        batch_size=batch_size,
+    )
+    return len(daily), len(monthly)
+
+
+def verify(user=None):
+    """Return a list of ``(kind, key, expected, actual)`` mismatches."""
+    expected_daily, expected_monthly = get_backend().completion_counts(user)
+    actual_daily, actual_monthly = _actual(user)
+    problems = []
+    for kind, expected, actual in (
+        ("daily", expected_daily, actual_daily),
+        ("monthly", expected_monthly, actual_monthly),
+    ):
+        for key in sorted(set(expected) | set(actual)):
+            if expected.get(key, 0) != actual.get(key, 0):
+                problems.append((kind, key, expected.get(key, 0), actual.get(key, 0)))
+    return problems
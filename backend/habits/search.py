@@ -0,0 +1,130 @@
+"""Full-text search over journal entries.
+
+SQLite keeps an FTS5 index (``habits_journal_fts``, external content over
+``habits_journalentry``) that triggers update on every insert, update and
+delete, so ``update_or_create`` and any other write path stay in sync.
+PostgreSQL uses a GIN index on ``to_tsvector('english', text)``, which the
+database maintains by itself. Both are created by :func:`install` from
+migration ``0012_journal_search``.
+
+On SQLite, a migration that rebuilds the journal table (adding a NOT NULL
+column, changing a column type...) drops the triggers with the old table;
+such a migration must call :func:`install` again.
+
+:func:`search` returns a user's entries ranked by relevance (BM25 on
+SQLite, ``ts_rank`` on PostgreSQL) with an HTML snippet per entry in
+which the matched terms are wrapped in ``<mark>``.
+"""
+from django.db import connection as default_connection
+from django.utils.html import escape
+import re
+
+FTS_TABLE = "habits_journal_fts"
+JOURNAL_TABLE = "habits_journalentry"
+PG_INDEX = "habits_journal_text_search"
+PG_CONFIG = "english"
+
+SNIPPET_WORDS = 16
+# private-use characters mark the matches until the snippet is HTML-escaped
+_START, _STOP = "\ue000", "\ue001"
+_WORD = re.compile(r"\w+")
+
+_SQLITE_INSTALL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"text, content='{JOURNAL_TABLE}', content_rowid='id', tokenize='porter unicode61')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {JOURNAL_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {JOURNAL_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF text ON {JOURNAL_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text); "
+    f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); END",
+    # index the rows written before the triggers existed
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+)
+
+_SQLITE_UNINSTALL = (
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+)
+
+_PG_INSTALL = (
+    f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON {JOURNAL_TABLE} USING GIN (to_tsvector('{PG_CONFIG}', text))",
+)
+
+_PG_UNINSTALL = (f"DROP INDEX IF EXISTS {PG_INDEX}",)
+
+# the %s placeholders are (query, user_id, limit, offset)
+_SQLITE_SEARCH = (
+    f"SELECT j.date, snippet({FTS_TABLE}, 0, %s, %s, '…', {SNIPPET_WORDS}) "
+    f"FROM {FTS_TABLE} JOIN {JOURNAL_TABLE} j ON j.id = {FTS_TABLE}.rowid "
+    f"WHERE {FTS_TABLE} MATCH %s AND j.user_id = %s "
+    f"ORDER BY {FTS_TABLE}.rank, j.date DESC LIMIT %s OFFSET %s"
+)
+
+_PG_SEARCH = (
+    f"SELECT j.date, ts_headline('{PG_CONFIG}', j.text, q.query, %s) "
+    f"FROM {JOURNAL_TABLE} j, to_tsquery('{PG_CONFIG}', %s) AS q(query) "
+    f"WHERE to_tsvector('{PG_CONFIG}', j.text) @@ q.query AND j.user_id = %s "
+    f"ORDER BY ts_rank(to_tsvector('{PG_CONFIG}', j.text), q.query) DESC, j.date DESC LIMIT %s OFFSET %s"
+)
+
+
+def install(connection):
+    """Create the search index for ``connection`` (idempotent)."""
+    statements = {"sqlite": _SQLITE_INSTALL, "postgresql": _PG_INSTALL}.get(connection.vendor, ())
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def uninstall(connection):
+    statements = {"sqlite": _SQLITE_UNINSTALL, "postgresql": _PG_UNINSTALL}.get(connection.vendor, ())
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def terms(query):
+    """The words of a free-text query; punctuation and operators are dropped."""
+    return _WORD.findall(query)
+
+
+def _fts_query(words):
+    # every word must match, the last one as a prefix (search as you type);
+    # quoting keeps words like AND/NEAR from being read as FTS5 operators
+    quoted = ['"%s"' % w for w in words]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _pg_query(words):
+    # the same query for to_tsquery: quoted lexemes joined with &, the last
+    # one a prefix; quotes and backslashes are doubled so nothing in the
+    # input can be read as tsquery syntax
+    quoted = ["'%s'" % w.replace("\\", "\\\\").replace("'", "''") for w in words]
+    quoted[-1] += ":*"
+    return " & ".join(quoted)
+
+
+def _highlight(snippet):
+    return escape(snippet).replace(_START, "<mark>").replace(_STOP, "</mark>")
+
+
+def search(user, query, limit=20, offset=0, connection=default_connection):
+    """Return ``[(date, snippet_html)]`` for ``user``'s entries matching ``query``, best first."""
+    words = terms(query)
+    if not words:
+        return []
+    if connection.vendor == "postgresql":
+        options = f"StartSel={_START}, StopSel={_STOP}, MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}"
+        sql, params = _PG_SEARCH, [options, _pg_query(words), user.id, limit, offset]
+    else:
+        sql, params = _SQLITE_SEARCH, [_START, _STOP, _fts_query(words), user.id, limit, offset]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    # SQLite returns dates as ISO strings, PostgreSQL as dates
+    return [(str(date), _highlight(snippet)) for date, snippet in rows]
@@ -0,0 +1,29 @@
+"""SQLite tuning for concurrent writers.
+
+When ``settings.HABITS_SQLITE_TUNING`` is on, every new SQLite connection
+switches to WAL journaling (readers no longer block the writer and vice
+versa), ``synchronous=NORMAL`` (safe with WAL, one fsync per checkpoint
+instead of per commit), a memory-mapped read window and a busy timeout so
+a writer waits for the lock instead of failing with "database is locked".
+
+Writes are serialized by opening transactions with ``BEGIN IMMEDIATE``
+(the ``transaction_mode`` option in ``settings.DATABASES``): a deferred
+transaction that reads first and then tries to write cannot wait for the
+lock and fails straight away, whatever the busy timeout.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+
+def tune_connection(sender, connection, **kwargs):
+    if connection.vendor != "sqlite" or not getattr(settings, "HABITS_SQLITE_TUNING", False):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA mmap_size=%d" % getattr(settings, "HABITS_SQLITE_MMAP_SIZE", 128 * 1024 * 1024))
+        cursor.execute("PRAGMA busy_timeout=%d" % getattr(settings, "HABITS_SQLITE_BUSY_TIMEOUT", 5000))
+
+
+def connect():
+    connection_created.connect(tune_connection, dispatch_uid="habits.sqlite.tune_connection")
@@ -0,0 +1,413 @@
+"""Read/write helpers for habit completion history.
+
+Two storage modes are available, selected with ``settings.HABITS_STORAGE``:
+
+* ``"rows"`` (default) keeps one ``HabitEntry`` row per completed habit
+  day; a missing row means "not completed".
+* ``"bitset"`` keeps one ``HabitMonth`` row per habit per month, with the
+  completed days packed into a 31-bit mask.
+
+Views only talk to the helpers returned by :func:`get_backend`, which work
+in terms of month masks (bit ``day - 1`` set when completed) so that month
+payloads and counts are bit operations in either mode. Existing rows are
+converted with the `convert_storage` management command.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from . import tombstones
+from .models import HabitEntry, HabitMonth, Tombstone
+import calendar
+import datetime as dt
+
+
+def day_bit(day):
+    return 1 << (day - 1)
+
+
+def _after(rows, position):
+    """Rows strictly after ``position = (updated_at, id)`` in keyset order."""
+    if position is None:
+        return rows
+    updated_at, pk = position
+    return rows.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, pk__gt=pk))
+
+
+def mask_days(mask):
+    """Yield the 1-based days set in ``mask``, in order."""
+    day = 1
+    while mask:
+        if mask & 1:
+            yield day
+        mask >>= 1
+        day += 1
+
+
+class RowStorage:
+    """One ``HabitEntry`` row per habit per day."""
+
+    name = "rows"
+
+    def month_masks(self, user, year, month, habit_ids):
+        """Return ``{habit_id: mask}`` for ``habit_ids`` in one month."""
+        masks = {hid: 0 for hid in habit_ids}
+        for habit_id, date in self._month_entries(user, year, month, habit_ids):
+            masks[habit_id] |= day_bit(date.day)
+        return masks
+
+    async def amonth_masks(self, user, year, month, habit_ids):
+        """Async :meth:`month_masks`."""
+        masks = {hid: 0 for hid in habit_ids}
+        async for habit_id, date in self._month_entries(user, year, month, habit_ids):
+            masks[habit_id] |= day_bit(date.day)
+        return masks
+
+    def _month_entries(self, user, year, month, habit_ids):
+        return HabitEntry.objects.filter(
+            user=user, habit__in=habit_ids, date__year=year, date__month=month, completed=True
+        ).order_by().values_list("habit_id", "date")
+
+    def year_masks(self, user, year, habit_ids):
+        """Return ``{habit_id: {month: mask}}`` for one year, in one query."""
+        masks = {hid: {} for hid in habit_ids}
+        entries = HabitEntry.objects.filter(
+            user=user, habit__in=habit_ids, date__year=year, completed=True
+        ).order_by().values_list("habit_id", "date")
+        for habit_id, date in entries:
+            months = masks[habit_id]
+            months[date.month] = months.get(date.month, 0) | day_bit(date.day)
+        return masks
+
+    def completed_on(self, user, date):
+        """Return the ids of the user's habits completed on ``date``."""
+        return set(
+            HabitEntry.objects.filter(user=user, date=date, completed=True).values_list("habit_id", flat=True)
+        )
+
+    def is_completed(self, user, habit, date):
+        return HabitEntry.objects.filter(habit=habit, date=date, completed=True).exists()
+
+    def _insert_missing(self, user_id, keys):
+        """Insert completed rows for ``keys`` and return the keys actually inserted.
+
+        ``INSERT ... ON CONFLICT (habit_id, date) DO NOTHING``: a day that has
+        no row yet cannot be locked, so whether it was new is taken from the
+        insert itself. Of two concurrent completions of the same day, exactly
+        one inserts it.
+        """
+        opts = HabitEntry._meta
+        qn = connection.ops.quote_name
+        columns = [opts.get_field(name).column for name in ("habit", "user", "date", "completed", "updated_at")]
+        now = opts.get_field("updated_at").get_db_prep_value(timezone.now(), connection)
+        sql = "INSERT INTO %s (%s) VALUES %%s ON CONFLICT (%s, %s) DO NOTHING" % (
+            qn(opts.db_table), ", ".join(qn(c) for c in columns), qn(columns[0]), qn(columns[2]),
+        )
+        row = "(%s)" % ", ".join(["%s"] * len(columns))
+
+        def params(habit_id, date):
+            return [habit_id, user_id, connection.ops.adapt_datefield_value(date), True, now]
+
+        inserted = set()
+        with connection.cursor() as cursor:
+            if connection.features.can_return_rows_from_bulk_insert:
+                cursor.execute(
+                    sql % ", ".join([row] * len(keys)) + " RETURNING %s, %s" % (qn(columns[0]), qn(columns[2])),
+                    [p for key in keys for p in params(*key)],
+                )
+                by_iso = {(habit_id, date.isoformat()): (habit_id, date) for habit_id, date in keys}
+                # SQLite returns the date as an ISO string, PostgreSQL as a date
+                inserted = {by_iso[(habit_id, str(date))] for habit_id, date in cursor.fetchall()}
+            else:
+                for key in keys:
+                    cursor.execute(sql % row, params(*key))
+                    if cursor.rowcount:
+                        inserted.add(key)
+        tombstones.clear(user_id, Tombstone.ENTRY, [tombstones.entry_key(*key) for key in inserted])
+        return inserted
+
+    def set_completed(self, user, habit, date, completed):
+        """Store the completion state for one day and return the previous one.
+
+        The previous state is read from the write (row inserted, updated or
+        deleted), never from an earlier ``SELECT``, so concurrent toggles of
+        the same day report each change exactly once.
+        """
+        key = (habit.id, date)
+        with transaction.atomic(savepoint=False):
+            if completed:
+                if self._insert_missing(user.id, [key]):
+                    return False
+                # the row exists; an un-completed one from older versions is flipped
+                flipped = HabitEntry.objects.filter(habit=habit, date=date, completed=False).update(
+                    completed=True, updated_at=timezone.now()
+                )
+                return not flipped
+            deleted, _ = HabitEntry.objects.filter(habit=habit, date=date, completed=True).delete()
+            if deleted:
+                tombstones.record(user.id, Tombstone.ENTRY, [tombstones.entry_key(*key)])
+            return bool(deleted)
+
+    def set_many(self, user, changes):
+        """Store ``{(habit_id, date): completed}`` and return the previous states.
+
+        Existing rows are read and locked in one query; new days are inserted
+        with one ``INSERT ... ON CONFLICT DO NOTHING`` (a day inserted by a
+        concurrent request since the read counts as already completed) and
+        un-completed ones removed with one delete.
+        """
+        habit_ids = {hid for hid, _ in changes}
+        dates = {d for _, d in changes}
+        with transaction.atomic(savepoint=False):
+            existing = {
+                (habit_id, date): completed
+                for habit_id, date, completed in HabitEntry.objects.select_for_update()
+                .filter(habit__in=habit_ids, date__in=dates).values_list("habit_id", "date", "completed")
+                if (habit_id, date) in changes
+            }
+            previous = {}
+            to_insert = []
+            to_flip = Q()
+            to_delete = Q()
+            deleted = []
+            for key, completed in changes.items():
+                was_completed = existing.get(key)
+                previous[key] = bool(was_completed)
+                if completed and was_completed is None:
+                    to_insert.append(key)
+                elif completed and not was_completed:
+                    to_flip |= Q(habit_id=key[0], date=key[1])
+                elif not completed and was_completed:
+                    to_delete |= Q(habit_id=key[0], date=key[1])
+                    deleted.append(tombstones.entry_key(*key))
+            if to_insert:
+                inserted = self._insert_missing(user.id, to_insert)
+                for key in to_insert:
+                    previous[key] = key not in inserted
+            if to_flip:
+                HabitEntry.objects.filter(to_flip).update(completed=True, updated_at=timezone.now())
+            if to_delete:
+                HabitEntry.objects.filter(to_delete).delete()
+                tombstones.record(user.id, Tombstone.ENTRY, deleted)
+        return previous
+
+    def entry_changes(self, user, after=None, limit=500):
+        """Return up to ``limit`` changes after ``after`` as ``(updated_at, id, days)``.
+
+        ``days`` lists the ``(habit_id, date, completed)`` states the change
+        sets; deleted entries are reported as tombstones instead.
+        """
+        rows = _after(HabitEntry.objects.filter(user=user, completed=True), after)
+        return [
+            (updated_at, pk, [(habit_id, date, True)])
+            for pk, updated_at, habit_id, date in rows.order_by("updated_at", "id")
+            .values_list("id", "updated_at", "habit_id", "date")[:limit]
+        ]
+
+    def iter_completed_dates(self, habit_id, start=None, end=None, descending=False, chunk_size=64):
+        """Yield the habit's completed dates within ``[start, end]``, in date order."""
+        dates = HabitEntry.objects.filter(habit_id=habit_id, completed=True)
+        if start is not None:
+            dates = dates.filter(date__gte=start)
+        if end is not None:
+            dates = dates.filter(date__lte=end)
+        dates = dates.order_by("-date" if descending else "date").values_list("date", flat=True)
+        yield from dates.iterator(chunk_size=chunk_size)
+
+    def iter_entries(self, user=None, year=None, chunk_size=2000):
+        """Yield ``(user_id, habit_id, date, completed)`` ordered by user, habit and date."""
+        entries = HabitEntry.objects.order_by("user_id", "habit_id", "date")
+        if user is not None:
+            entries = entries.filter(user=user)
+        if year is not None:
+            entries = entries.filter(date__year=year)
+        yield from entries.values_list("user_id", "habit_id", "date", "completed").iterator(chunk_size=chunk_size)
+
+    def completion_counts(self, user=None):
+        """Completed counts keyed by ``(user_id, date)`` and ``(user_id, year, month)``."""
+        completed = HabitEntry.objects.filter(completed=True).order_by()
+        if user is not None:
+            completed = completed.filter(user=user)
+        daily = {
+            (r["user_id"], r["date"]): r["n"]
+            for r in completed.values("user_id", "date").annotate(n=Count("id"))
+        }
+        monthly = {
+            (r["user_id"], r["y"], r["m"]): r["n"]
+            for r in completed.annotate(y=ExtractYear("date"), m=ExtractMonth("date"))
+            .values("user_id", "y", "m").annotate(n=Count("id"))
+        }
+        return daily, monthly
+
+
+class BitsetStorage:
+    """One ``HabitMonth`` row per habit per month with a completion mask."""
+
+    name = "bitset"
+
+    def month_masks(self, user, year, month, habit_ids):
+        """Return ``{habit_id: mask}`` for ``habit_ids`` in one month."""
+        masks = {hid: 0 for hid in habit_ids}
+        rows = HabitMonth.objects.filter(user=user, habit__in=habit_ids, year=year, month=month)
+        masks.update(rows.values_list("habit_id", "mask"))
+        return masks
+
+    async def amonth_masks(self, user, year, month, habit_ids):
+        """Async :meth:`month_masks`."""
+        masks = {hid: 0 for hid in habit_ids}
+        rows = HabitMonth.objects.filter(user=user, habit__in=habit_ids, year=year, month=month)
+        async for habit_id, mask in rows.values_list("habit_id", "mask"):
+            masks[habit_id] = mask
+        return masks
+
+    def year_masks(self, user, year, habit_ids):
+        """Return ``{habit_id: {month: mask}}`` for one year, in one query."""
+        masks = {hid: {} for hid in habit_ids}
+        rows = HabitMonth.objects.filter(user=user, habit__in=habit_ids, year=year).exclude(mask=0)
+        for habit_id, month, mask in rows.values_list("habit_id", "month", "mask"):
+            masks[habit_id][month] = mask
+        return masks
+
+    def completed_on(self, user, date):
+        bit = day_bit(date.day)
+        rows = HabitMonth.objects.filter(user=user, year=date.year, month=date.month).values_list("habit_id", "mask")
+        return {habit_id for habit_id, mask in rows if mask & bit}
+
+    def is_completed(self, user, habit, date):
+        mask = (
+            HabitMonth.objects.filter(habit=habit, year=date.year, month=date.month)
+            .values_list("mask", flat=True).first()
+        )
+        return bool((mask or 0) & day_bit(date.day))
+
+    def set_completed(self, user, habit, date, completed):
+        """Store the completion state for one day and return the previous one."""
+        bit = day_bit(date.day)
+        with transaction.atomic(savepoint=False):
+            row, _ = HabitMonth.objects.select_for_update().get_or_create(
+                habit=habit, year=date.year, month=date.month, defaults={"user": user}
+            )
+            was_completed = bool(row.mask & bit)
+            if was_completed != completed:
+                mask = F("mask").bitor(bit) if completed else F("mask").bitand(~bit)
+                HabitMonth.objects.filter(pk=row.pk).update(mask=mask, updated_at=timezone.now())
+            return was_completed
+
+    def set_many(self, user, changes):
+        """Store ``{(habit_id, date): completed}`` and return the previous states."""
+        habit_ids = {hid for hid, _ in changes}
+        months = {(d.year, d.month) for _, d in changes}
+        with transaction.atomic(savepoint=False):
+            # a missing row cannot be locked: create the months that gain a day
+            # first (a concurrent writer's row wins), then lock them all
+            HabitMonth.objects.bulk_create(
+                [
+                    HabitMonth(habit_id=habit_id, user=user, year=y, month=m)
+                    for habit_id, y, m in {(hid, d.year, d.month) for (hid, d), completed in changes.items() if completed}
+                ],
+                ignore_conflicts=True,
+            )
+            rows = {
+                (r.habit_id, r.year, r.month): r
+                for r in HabitMonth.objects.select_for_update().filter(
+                    habit__in=habit_ids, year__in={y for y, _ in months}, month__in={m for _, m in months}
+                )
+            }
+            previous = {}
+            touched = {}
+            for (habit_id, date), completed in changes.items():
+                key = (habit_id, date.year, date.month)
+                row = rows.get(key)
+                if row is None:
+                    # only un-completes reach here; the day is not completed either way
+                    previous[(habit_id, date)] = False
+                    continue
+                bit = day_bit(date.day)
+                previous[(habit_id, date)] = bool(row.mask & bit)
+                new_mask = row.mask | bit if completed else row.mask & ~bit
+                if new_mask != row.mask:
+                    row.mask = new_mask
+                    touched[key] = row
+            if touched:
+                # bulk_update does not apply auto_now
+                now = timezone.now()
+                for row in touched.values():
+                    row.updated_at = now
+                HabitMonth.objects.bulk_update(touched.values(), ["mask", "updated_at"])
+        return previous
+
+    def entry_changes(self, user, after=None, limit=500):
+        """Return up to ``limit`` changes after ``after`` as ``(updated_at, id, days)``.
+
+        A changed month reports the ``(habit_id, date, completed)`` state of
+        each of its days, so un-completed days need no tombstones.
+        """
+        rows = _after(HabitMonth.objects.filter(user=user), after)
+        changes = []
+        for pk, updated_at, habit_id, year, month, mask in rows.order_by("updated_at", "id").values_list(
+            "id", "updated_at", "habit_id", "year", "month", "mask"
+        )[:limit]:
+            days = [
+                (habit_id, dt.date(year, month, day), bool(mask & day_bit(day)))
+                for day in range(1, calendar.monthrange(year, month)[1] + 1)
+            ]
+            changes.append((updated_at, pk, days))
+        return changes
+
+    def iter_completed_dates(self, habit_id, start=None, end=None, descending=False, chunk_size=16):
+        """Yield the habit's completed dates within ``[start, end]``, in date order."""
+        rows = HabitMonth.objects.filter(habit_id=habit_id).exclude(mask=0)
+        if start is not None:
+            rows = rows.filter(Q(year__gt=start.year) | Q(year=start.year, month__gte=start.month))
+        if end is not None:
+            rows = rows.filter(Q(year__lt=end.year) | Q(year=end.year, month__lte=end.month))
+        order = ("-year", "-month") if descending else ("year", "month")
+        for year, month, mask in rows.order_by(*order).values_list("year", "month", "mask").iterator(chunk_size=chunk_size):
+            days = list(mask_days(mask))
+            if descending:
+                days.reverse()
+            for day in days:
+                date = dt.date(year, month, day)
+                if (start is None or date >= start) and (end is None or date <= end):
+                    yield date
+
+    def iter_entries(self, user=None, year=None, chunk_size=2000):
+        """Yield ``(user_id, habit_id, date, True)`` for every completed day, in order."""
+        rows = HabitMonth.objects.exclude(mask=0).order_by("user_id", "habit_id", "year", "month")
+        if user is not None:
+            rows = rows.filter(user=user)
+        if year is not None:
+            rows = rows.filter(year=year)
+        for user_id, habit_id, y, m, mask in rows.values_list(
+            "user_id", "habit_id", "year", "month", "mask"
+        ).iterator(chunk_size=chunk_size):
+            for day in mask_days(mask):
+                yield user_id, habit_id, dt.date(y, m, day), True
+
+    def completion_counts(self, user=None):
+        """Completed counts keyed by ``(user_id, date)`` and ``(user_id, year, month)``."""
+        rows = HabitMonth.objects.exclude(mask=0)
+        if user is not None:
+            rows = rows.filter(user=user)
+        daily = {}
+        monthly = {}
+        for user_id, year, month, mask in rows.values_list("user_id", "year", "month", "mask").iterator():
+            monthly[(user_id, year, month)] = monthly.get((user_id, year, month), 0) + mask.bit_count()
+            for day in mask_days(mask):
+                key = (user_id, dt.date(year, month, day))
+                daily[key] = daily.get(key, 0) + 1
+        return daily, monthly
+
+
+_BACKENDS = {cls.name: cls for cls in (RowStorage, BitsetStorage)}
+
+
+def get_backend():
+    """Return the storage helpers for the configured ``HABITS_STORAGE`` mode."""
+    name = getattr(settings, "HABITS_STORAGE", "rows")
+    try:
+        return _BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown HABITS_STORAGE {name!r}; expected one of {sorted(_BACKENDS)}")
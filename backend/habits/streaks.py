@@ -0,0 +1,176 @@
+"""Current/longest streak maintenance for ``HabitStats``.
+
+A streak is a run of consecutive completed days. :func:`recompute` derives
+a habit's stats from its whole history in one linear pass. Toggles go
+through :func:`record_change`, which updates them from the stored runs:
+changes in or next to the most recent run need no history at all, and
+changes to earlier days only walk the runs around the changed date. A full
+pass remains only for the cases the stored runs cannot answer: an earlier
+run that was the longest one shrinks, or is merged into the most recent
+run, or the most recent run vanishes while the run before it was the
+longest.
+"""
+from .models import Habit, HabitStats
+from .storage import get_backend
+import datetime as dt
+
+ONE_DAY = dt.timedelta(days=1)
+
+
+def summarize(dates):
+    """Return ``(longest, last_run_end, last_run_length, longest_earlier)`` for ascending ``dates``."""
+    longest = 0
+    earlier = 0
+    run_end = None
+    run_length = 0
+    for date in dates:
+        if run_end is not None and date - run_end == ONE_DAY:
+            run_length += 1
+        else:
+            earlier = max(earlier, run_length)
+            run_length = 1
+        run_end = date
+        longest = max(longest, run_length)
+    return longest, run_end, run_length, earlier
+
+
+def recompute(habit_id):
+    """Recompute one habit's stats from its full history and store them."""
+    longest, end, length, earlier = summarize(get_backend().iter_completed_dates(habit_id))
+    stats, _ = HabitStats.objects.update_or_create(
+        habit_id=habit_id,
+        defaults={
+            "longest_streak": longest, "last_run_end": end, "last_run_length": length, "longest_earlier": earlier,
+        },
+    )
+    return stats
+
+
+def rebuild(user=None):
+    """Recompute the stats of every habit (of ``user``, when given)."""
+    habits = Habit.objects.all() if user is None else Habit.objects.filter(user=user)
+    count = 0
+    for habit_id in habits.values_list("id", flat=True).iterator():
+        recompute(habit_id)
+        count += 1
+    return count
+
+
+def _run_length(habit_id, start, step):
+    """Count consecutive completed days from ``start`` moving ``step`` at a time."""
+    storage = get_backend()
+    if step < 0:
+        dates = storage.iter_completed_dates(habit_id, end=start, descending=True)
+    else:
+        dates = storage.iter_completed_dates(habit_id, start=start)
+    expected = start
+    length = 0
+    for date in dates:
+        if date != expected:
+            break
+        length += 1
+        expected += step * ONE_DAY
+    return length
+
+
+def _previous_run(habit_id, before):
+    """Return ``(end, length)`` of the latest run ending before ``before``, or ``(None, 0)``."""
+    end = None
+    length = 0
+    for date in get_backend().iter_completed_dates(habit_id, end=before - ONE_DAY, descending=True):
+        if end is not None and date != end - length * ONE_DAY:
+            break
+        end = end or date
+        length += 1
+    return end, length
+
+
+def _neighbours(habit_id, date):
+    """Return whether the days before and after ``date`` are completed (one query)."""
+    around = set(get_backend().iter_completed_dates(habit_id, start=date - ONE_DAY, end=date + ONE_DAY))
+    return date - ONE_DAY in around, date + ONE_DAY in around
+
+
+def _earlier_run(habit_id, date):
+    """Lengths of the completed runs just before and just after ``date``."""
+    has_left, has_right = _neighbours(habit_id, date)
+    left = _run_length(habit_id, date - ONE_DAY, -1) if has_left else 0
+    right = _run_length(habit_id, date + ONE_DAY, 1) if has_right else 0
+    return left, right
+
+
+def _completed(stats, habit_id, date):
+    """Apply ``date`` becoming completed; False when a full pass is needed."""
+    end, length = stats.last_run_end, stats.last_run_length
+    if end is None or date > end + ONE_DAY:
+        # a new most recent run; the previous one becomes an earlier run
+        stats.longest_earlier = max(stats.longest_earlier, length)
+        stats.last_run_end, stats.last_run_length = date, 1
+    elif date == end + ONE_DAY:
+        stats.last_run_end, stats.last_run_length = date, length + 1
+    elif date == end - length * ONE_DAY:
+        # joins the most recent run, together with any run ending the day before
+        left = _run_length(habit_id, date - ONE_DAY, -1)
+        if left and left >= stats.longest_earlier:
+            return False
+        stats.last_run_length = length + 1 + left
+    else:
+        left, right = _earlier_run(habit_id, date)
+        stats.longest_earlier = max(stats.longest_earlier, left + 1 + right)
+    return True
+
+
+def _uncompleted(stats, habit_id, date):
+    """Apply ``date`` no longer being completed; False when a full pass is needed."""
+    end, length = stats.last_run_end, stats.last_run_length
+    start = end - (length - 1) * ONE_DAY if end is not None else None
+    if start is not None and start <= date <= end:
+        left = (date - start).days
+        right = (end - date).days
+        if right:
+            # the part before `date` becomes an earlier run
+            stats.longest_earlier = max(stats.longest_earlier, left)
+            stats.last_run_length = right
+        elif left:
+            stats.last_run_end, stats.last_run_length = date - ONE_DAY, left
+        else:
+            # the most recent run vanished; the run before it takes its place
+            previous_end, previous_length = _previous_run(habit_id, date)
+            if previous_length and previous_length >= stats.longest_earlier:
+                return False
+            stats.last_run_end, stats.last_run_length = previous_end, previous_length
+        return True
+    left, right = _earlier_run(habit_id, date)
+    # an earlier run splits; only a split of the longest one is unknown
+    return left + 1 + right < stats.longest_earlier
+
+
+def record_change(habit_id, date, was_completed, completed):
+    """Update the stats after ``date`` went from ``was_completed`` to ``completed``.
+
+    Must run after the entry write, inside the same transaction.
+    """
+    if bool(was_completed) == bool(completed):
+        return
+    stats = HabitStats.objects.select_for_update().filter(habit_id=habit_id).first()
+    if stats is None:
+        recompute(habit_id)
+        return
+    updated = _completed(stats, habit_id, date) if completed else _uncompleted(stats, habit_id, date)
+    if not updated:
+        recompute(habit_id)
+        return
+    if stats.last_run_end is None:
+        stats.longest_earlier = 0
+    stats.longest_streak = max(stats.longest_earlier, stats.last_run_length)
+    stats.save()
+
+
+def stats_for(habit_ids):
+    """Return ``{habit_id: HabitStats}`` for the habits that have stats, in one query."""
+    return {s.habit_id: s for s in HabitStats.objects.filter(habit__in=habit_ids)}
+
+
+async def astats_for(habit_ids):
+    """Async :func:`stats_for`."""
+    return {s.habit_id: s async for s in HabitStats.objects.filter(habit__in=habit_ids)}
@@ -0,0 +1,134 @@
+"""Delta sync: what changed for a user since an opaque cursor.
+
+Habits, habit entries, journal entries and tombstones are each read in
+``(updated_at, id)`` keyset order from their ``(user, updated_at)`` index,
+up to ``limit`` records per stream. The cursor records the last position
+seen in every stream, so a returning device downloads only what changed
+since its previous sync instead of whole month or year payloads. Without a
+cursor the first pages carry the full state.
+
+Clients apply ``deleted`` and the changed records in any order: a key is
+never both present and deleted (see :mod:`habits.tombstones`).
+
+``updated_at`` is stamped before the writing transaction commits, so a slow
+transaction can become visible after a reader has already paged past its
+stamp. The cursor handed out with the last page (``has_more`` false)
+therefore does not point past ``OVERLAP`` before the time of the read: the
+next sync reads the most recent changes again and picks up the late ones.
+Records are sent as their current state, so seeing one twice is harmless.
+Pages within one sync keep exact positions so that paging always advances.
+"""
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Habit, JournalEntry, Tombstone
+from .storage import get_backend
+import base64
+import datetime as dt
+import json
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 1000
+# how long a write may take to commit and still be picked up by the next sync
+OVERLAP = dt.timedelta(seconds=60)
+
+STREAMS = ("h", "e", "j", "d")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(positions):
+    data = {k: [v[0].isoformat(), v[1]] for k, v in positions.items() if v is not None}
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return ``{stream: (updated_at, id) or None}``; raises :class:`InvalidCursor`."""
+    positions = dict.fromkeys(STREAMS)
+    if not cursor:
+        return positions
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        for key, (stamp, pk) in data.items():
+            if key not in positions or not isinstance(pk, int):
+                raise ValueError(key)
+            stamp = dt.datetime.fromisoformat(stamp)
+            if stamp.tzinfo is None:
+                # the cursors we hand out are always aware
+                raise ValueError(stamp)
+            positions[key] = (stamp, pk)
+    except (ValueError, TypeError, AttributeError):
+        raise InvalidCursor(cursor)
+    return positions
+
+
+def _page(rows, position, limit, *fields):
+    if position is not None:
+        stamp, pk = position
+        rows = rows.filter(Q(**{fields[0] + "__gt": stamp}) | Q(**{fields[0]: stamp, "pk__gt": pk}))
+    return list(rows.order_by(fields[0], "id").values_list(*fields, "id")[:limit + 1])
+
+
+def _deleted(kind, key):
+    if kind == Tombstone.HABIT:
+        return {"type": kind, "id": int(key)}
+    if kind == Tombstone.ENTRY:
+        habit_id, date = key.split(":")
+        return {"type": kind, "habit_id": int(habit_id), "date": date}
+    return {"type": kind, "date": key}
+
+
+def _settled(positions, read_at):
+    """Move positions later than ``OVERLAP`` before ``read_at`` back to that point."""
+    floor = (read_at - OVERLAP, 0)
+    return {k: v if v is None or v <= floor else floor for k, v in positions.items()}
+
+
+def changes(user, cursor=None, limit=DEFAULT_LIMIT):
+    """Return the sync payload for ``user`` after ``cursor``."""
+    positions = decode_cursor(cursor)
+    read_at = timezone.now()
+    more = False
+
+    habits = _page(Habit.objects.filter(user=user), positions["h"], limit, "updated_at", "title")
+    more |= len(habits) > limit
+    habits = habits[:limit]
+    if habits:
+        positions["h"] = (habits[-1][0], habits[-1][2])
+
+    entry_changes = get_backend().entry_changes(user, positions["e"], limit + 1)
+    more |= len(entry_changes) > limit
+    entry_changes = entry_changes[:limit]
+    if entry_changes:
+        positions["e"] = entry_changes[-1][:2]
+
+    journal = _page(JournalEntry.objects.filter(user=user), positions["j"], limit, "updated_at", "date", "text")
+    more |= len(journal) > limit
+    journal = journal[:limit]
+    if journal:
+        positions["j"] = (journal[-1][0], journal[-1][3])
+
+    deleted = _page(Tombstone.objects.filter(user=user), positions["d"], limit, "deleted_at", "kind", "key")
+    more |= len(deleted) > limit
+    deleted = deleted[:limit]
+    if deleted:
+        positions["d"] = (deleted[-1][0], deleted[-1][3])
+
+    return {
+        "habits": [{"id": pk, "title": title, "updated_at": stamp.isoformat()} for stamp, title, pk in habits],
+        "entries": [
+            {"habit_id": habit_id, "date": date.isoformat(), "completed": completed}
+            for _, _, days in entry_changes
+            for habit_id, date, completed in days
+        ],
+        "journal": [
+            {"date": date.isoformat(), "text": text, "updated_at": stamp.isoformat()}
+            for stamp, date, text, _ in journal
+        ],
+        "deleted": [_deleted(kind, key) for _, kind, key, _ in deleted],
+        "cursor": encode_cursor(positions if more else _settled(positions, read_at)),
+        "has_more": more,
+    }
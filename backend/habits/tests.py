@@ -1,3 +1,822 @@
-from django.test import TestCase
+from asgiref.sync import ThreadSensitiveContext
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection, connections
+from django.db.models import F, Q
+from django.conf import settings
+from django.core.management import call_command
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from unittest import mock
+import asyncio
+import base64
+import io
+import datetime as dt
+import random
+import threading
+import types
+import unittest
 
-# Create your tests here.
+from .management.commands.stress_sqlite import run_toggles
+from . import assets, caching, events, instrumentation, rollups, search, streaks, sync
+from .backfill import CHECKPOINT_TABLE, backfill
+from .heatmap import ENCODING
+from .jsx import JSXSyntaxError, compile_jsx
+from .models import DailyRollup, Habit, HabitEntry, HabitMonth, HabitStats, JournalEntry, Tombstone
+from .storage import BitsetStorage, RowStorage, day_bit, get_backend, mask_days
+
+
+def _in_threads(n, fn):
+    """Run ``fn(i)`` in ``n`` threads released together; return the results."""
+    barrier = threading.Barrier(n)
+
+    def run(i):
+        barrier.wait()
+        try:
+            return fn(i)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        return list(pool.map(run, range(n)))
+
+
+class ConcurrentToggleTests(TransactionTestCase):
+    """Concurrent writes to the same day must be counted exactly once."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("racer", password="pw")
+        self.habit = Habit.objects.create(user=self.user, title="Run")
+        HabitStats.objects.create(habit=self.habit)
+        self.today = timezone.localdate()
+
+    def _race(self, completed, threads=8):
+        def toggle(i):
+            return get_backend().set_completed(self.user, self.habit, self.today, completed)
+        return _in_threads(threads, toggle)
+
+    def _race_views(self, completed, threads=8):
+        def toggle(i):
+            from django.test import Client
+            client = Client()
+            client.force_login(self.user)
+            response = client.post("/api/toggle-entry/", {
+                "habit_id": self.habit.id, "date": self.today.isoformat(), "completed": str(completed).lower(),
+            })
+            return response.status_code
+        return _in_threads(threads, toggle)
+
+    def _check_storage(self):
+        previous = self._race(True)
+        self.assertEqual(previous.count(False), 1)
+        previous = self._race(False)
+        self.assertEqual(previous.count(True), 1)
+        self.assertFalse(get_backend().is_completed(self.user, self.habit, self.today))
+
+    def test_set_completed_rows(self):
+        self._check_storage()
+        self.assertFalse(HabitEntry.objects.exists())
+
+    @override_settings(HABITS_STORAGE="bitset")
+    def test_set_completed_bitset(self):
+        self._check_storage()
+
+    def _check_views(self):
+        self.assertEqual(self._race_views(True), [200] * 8)
+        self.assertEqual(rollups.verify(), [])
+        stats = HabitStats.objects.get(habit=self.habit)
+        self.assertEqual((stats.longest_streak, stats.last_run_end), (1, self.today))
+        self.assertEqual(self._race_views(False), [200] * 8)
+        self.assertEqual(rollups.verify(), [])
+        stats = streaks.recompute(self.habit.id)
+        self.assertEqual(stats.longest_streak, 0)
+
+    def test_toggle_views_rows(self):
+        self._check_views()
+
+    @override_settings(HABITS_STORAGE="bitset")
+    def test_toggle_views_bitset(self):
+        self._check_views()
+
+    def test_set_many_counts_concurrent_insert_as_completed(self):
+        storage = get_backend()
+        day = self.today.replace(day=1)
+        previous = _in_threads(4, lambda i: storage.set_many(self.user, {(self.habit.id, day): True}))
+        self.assertEqual([p[(self.habit.id, day)] for p in previous].count(False), 1)
+        self.assertEqual(HabitEntry.objects.filter(habit=self.habit, date=day).count(), 1)
+
+    @override_settings(HABITS_STORAGE="bitset")
+    def test_set_many_bitset_new_month(self):
+        storage = get_backend()
+        first = self.today.replace(day=1)
+        days = [first + dt.timedelta(days=i) for i in range(4)]
+        # each thread completes the same day and one of its own in a month without a row
+        previous = _in_threads(4, lambda i: storage.set_many(self.user, {
+            (self.habit.id, days[0]): True, (self.habit.id, days[i]): True,
+        }))
+        self.assertEqual([p[(self.habit.id, days[0])] for p in previous].count(False), 1)
+        self.assertEqual(HabitMonth.objects.get(habit=self.habit).mask, sum(day_bit(d.day) for d in days))
+
+
+class StreakTests(TestCase):
+    """``record_change`` must agree with a full ``recompute`` after every toggle."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("streaker", password="pw")
+        self.habit = Habit.objects.create(user=self.user, title="Read")
+        HabitStats.objects.create(habit=self.habit)
+        self.start = dt.date(2024, 1, 1)
+
+    def _toggle(self, date, completed):
+        was_completed = get_backend().set_completed(self.user, self.habit, date, completed)
+        streaks.record_change(self.habit.id, date, was_completed, completed)
+
+    def _stats(self):
+        stats = HabitStats.objects.get(habit=self.habit)
+        return stats.longest_streak, stats.last_run_end, stats.last_run_length, stats.longest_earlier
+
+    def _check_random_toggles(self):
+        rng = random.Random(11)
+        for _ in range(400):
+            self._toggle(self.start + dt.timedelta(days=rng.randrange(40)), rng.random() < 0.6)
+            incremental = self._stats()
+            self.assertEqual(incremental, self._stats_after_recompute())
+
+    def _stats_after_recompute(self):
+        streaks.recompute(self.habit.id)
+        return self._stats()
+
+    def test_random_toggles_rows(self):
+        self._check_random_toggles()
+
+    @override_settings(HABITS_STORAGE="bitset")
+    def test_random_toggles_bitset(self):
+        self._check_random_toggles()
+
+    def test_undo_last_day_of_longest_run_reads_no_history(self):
+        for offset in range(5):
+            self._toggle(self.start + dt.timedelta(days=offset), True)
+        last = self.start + dt.timedelta(days=4)
+        was_completed = get_backend().set_completed(self.user, self.habit, last, False)
+        # stats read and update only
+        with self.assertNumQueries(2):
+            streaks.record_change(self.habit.id, last, was_completed, False)
+        self.assertEqual(self._stats(), (4, last - dt.timedelta(days=1), 4, 0))
+
+
+class HabitDeletionTests(TestCase):
+    """Deleting a habit takes its completions out of the rollups."""
+
+    def setUp(self):
+        caches[settings.HABITS_CACHE_ALIAS].clear()
+        self.user = User.objects.create_user("deleter", password="pw")
+        self.client.force_login(self.user)
+        self.habits = [Habit.objects.create(user=self.user, title=t) for t in ("Run", "Read")]
+        # a finished month, whose cached progress only depends on the habits
+        self.month = (timezone.localdate().replace(day=1) - dt.timedelta(days=1)).replace(day=1)
+
+    def _complete_first_days(self):
+        storage = get_backend()
+        for habit in self.habits:
+            for day in range(3):
+                date = self.month + dt.timedelta(days=day)
+                rollups.record_change(self.user.id, date, storage.set_completed(self.user, habit, date, True), True)
+
+    def _progress(self):
+        response = self.client.get("/api/monthly-progress/", {"year": self.month.year, "month": self.month.month})
+        return response.json()
+
+    def _check_delete(self, delete):
+        self._complete_first_days()
+        self.assertEqual(self._progress()["percentages"][:3], [100.0] * 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            delete()
+        self.assertEqual(rollups.verify(), [])
+        self.assertEqual(self._progress()["counts"][:3], [1] * 3)
+        self.assertEqual(self._progress()["percentages"][:3], [100.0] * 3)
+
+    def test_delete_instance(self):
+        self._check_delete(self.habits[0].delete)
+
+    @override_settings(HABITS_STORAGE="bitset")
+    def test_delete_queryset_bitset(self):
+        self._check_delete(lambda: Habit.objects.filter(pk=self.habits[1].pk).delete())
+
+    def test_delete_user(self):
+        self._complete_first_days()
+        self.user.delete()
+        self.assertEqual(rollups.verify(), [])
+
+
+class SyncOverlapTests(TestCase):
+    """A change that commits after a sync read past its stamp is not lost."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("syncer", password="pw")
+        self.habit = Habit.objects.create(user=self.user, title="Run")
+        self.today = timezone.localdate()
+
+    def _complete(self, date, stamp):
+        get_backend().set_completed(self.user, self.habit, date, True)
+        HabitEntry.objects.filter(habit=self.habit, date=date).update(updated_at=stamp)
+
+    def _dates(self, data):
+        return [e["date"] for e in data["entries"]]
+
+    def test_late_commit_within_overlap_is_sent(self):
+        now = timezone.now()
+        self._complete(self.today, now)
+        first = sync.changes(self.user)
+        self.assertEqual(self._dates(first), [self.today.isoformat()])
+        # stamped before the row read above, committed after it
+        late = self.today - dt.timedelta(days=1)
+        self._complete(late, now - dt.timedelta(seconds=5))
+        again = sync.changes(self.user, first["cursor"])
+        self.assertIn(late.isoformat(), self._dates(again))
+        self.assertFalse(again["has_more"])
+
+    def test_settled_changes_are_not_sent_again(self):
+        settled = timezone.now() - 2 * sync.OVERLAP
+        Habit.objects.filter(pk=self.habit.pk).update(updated_at=settled)
+        self._complete(self.today, settled)
+        first = sync.changes(self.user)
+        self.assertEqual(len(first["entries"]), 1)
+        again = sync.changes(self.user, first["cursor"])
+        self.assertEqual((again["entries"], again["habits"]), ([], []))
+
+    def test_pages_advance_inside_the_overlap(self):
+        now = timezone.now()
+        for day in range(5):
+            self._complete(self.today - dt.timedelta(days=day), now)
+        seen = []
+        cursor = None
+        for _ in range(5):
+            data = sync.changes(self.user, cursor, limit=2)
+            seen += self._dates(data)
+            cursor = data["cursor"]
+            if not data["has_more"]:
+                break
+        self.assertFalse(data["has_more"])
+        self.assertEqual(len(set(seen)), 5)
+
+
+class BulkToggleEventTests(TestCase):
+    """A bulk toggle publishes one event, however many entries it changes."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("bulk", password="pw")
+        self.client.force_login(self.user)
+        self.habits = [Habit.objects.create(user=self.user, title=t) for t in ("Run", "Read")]
+        for habit in self.habits:
+            HabitStats.objects.create(habit=habit)
+
+    def _toggle(self, operations):
+        broker = mock.Mock()
+        with mock.patch.object(events, "get_broker", return_value=broker), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/toggle-entries/", {"operations": operations}, content_type="application/json",
+                headers={"X-Client-Id": "tab-1"},
+            )
+        self.assertEqual(response.status_code, 200)
+        return [call.args for call in broker.publish.call_args_list]
+
+    def test_one_event_per_request(self):
+        today = timezone.localdate()
+        days = [today.replace(day=d) for d in range(1, today.day + 1)][-3:]
+        operations = [
+            {"habit_id": h.id, "date": d.isoformat(), "completed": True} for h in self.habits for d in days
+        ]
+        published = self._toggle(operations)
+        self.assertEqual(published, [(self.user.id, {
+            "type": "entries", "habit_ids": sorted(h.id for h in self.habits), "client": "tab-1",
+        })])
+        # nothing changes the second time, so nothing is published
+        self.assertEqual(self._toggle(operations), [])
+
+
+class AsyncInstrumentationTests(TransactionTestCase):
+    """Async views report the queries their ORM calls run on the worker thread."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("metered", password="pw")
+        Habit.objects.create(user=self.user, title="Run")
+        instrumentation.reset()
+
+    def _queries(self, view):
+        return instrumentation._histograms[("habits_request_db_queries", view)].snapshot()[1:]
+
+    async def _get(self, client, path):
+        # like ASGIHandler, give each request its own thread for sync code
+        async with ThreadSensitiveContext():
+            return await client.get(path)
+
+    def test_overlapping_async_requests(self):
+        client = AsyncClient()
+        client.force_login(self.user)
+
+        async def requests(n):
+            return await asyncio.gather(*(
+                self._get(client, f"/api/async/monthly-progress/?month={m}") for m in range(1, n + 1)
+            ))
+
+        def run(n):
+            # a plain event loop, as under an ASGI server (async_to_sync would
+            # run every request's sync code back on this thread)
+            with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}):
+                self.assertEqual([r.status_code for r in asyncio.run(requests(n))], [200] * n)
+            connections.close_all()
+            return self._queries("async_monthly_progress")
+
+        alone, _ = run(1)
+        self.assertGreater(alone, 0)
+        # each overlapping request counts its own queries, once
+        self.assertEqual(run(4), (alone * 5, 5))
+
+
+class JSXCompilerTests(SimpleTestCase):
+
+    def test_division_after_postfix_operator(self):
+        self.assertEqual(
+            compile_jsx("const a = i++ / 2; const b = <div/>;"),
+            'const a = i++ / 2; const b = React.createElement("div", null);',
+        )
+        self.assertEqual(compile_jsx("n-- < <b/>"), 'n-- < React.createElement("b", null)')
+
+    def test_regex_and_division(self):
+        self.assertEqual(
+            compile_jsx("const r = /<p>[/]/g; const x = (a) / b / c; const e = <p/>;"),
+            'const r = /<p>[/]/g; const x = (a) / b / c; const e = React.createElement("p", null);',
+        )
+
+    def test_jsx_read_as_regex_is_an_error(self):
+        with self.assertRaises(JSXSyntaxError):
+            compile_jsx("x = y +/ 2; <div/>")
+
+    def test_entities_and_whitespace(self):
+        self.assertEqual(
+            compile_jsx('<p title="a &amp; b">\n  x&nbsp;&lt;y\n  z\n</p>'),
+            'React.createElement("p", {title: "a & b"}, "x\\u00a0<y z")',
+        )
+
+    def test_nested_braces(self):
+        self.assertEqual(
+            compile_jsx("<p style={{a: {b: 1}}}>{`${f({c: 2})}`}{/* note */}</p>"),
+            'React.createElement("p", {style: {a: {b: 1}}}, `${f({c: 2})}`)',
+        )
+
+    def test_unclosed_element(self):
+        with self.assertRaises(JSXSyntaxError):
+            compile_jsx("<div><span></div>")
+
+
+class HashedAssetTests(SimpleTestCase):
+
+    def test_is_hashed_follows_the_manifest(self):
+        storage = types.SimpleNamespace(hashed_files={"js/app.js": "js/app.0123abcd.js"})
+        with mock.patch.object(assets, "staticfiles_storage", storage):
+            self.assertTrue(assets._is_hashed("js/app.0123abcd.js"))
+            self.assertFalse(assets._is_hashed("js/app.js"))
+            # a reloaded manifest replaces the mapping
+            storage.hashed_files = {"js/app.js": "js/app.4567cdef.js"}
+            self.assertFalse(assets._is_hashed("js/app.0123abcd.js"))
+            self.assertTrue(assets._is_hashed("js/app.4567cdef.js"))
+
+
+class HomePageTests(TestCase):
+
+    def test_home_reads_no_habit_data(self):
+        user = User.objects.create_user("home", password="pw")
+        Habit.objects.create(user=user, title="Run")
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([q["sql"] for q in queries if "habits_" in q["sql"]], [])
+
+
+@unittest.skipUnless(
+    connection.vendor == "sqlite" and settings.HABITS_SQLITE_TUNING, "needs SQLite with HABITS_SQLITE_TUNING on"
+)
+class SQLiteStressTests(TransactionTestCase):
+    """The stress_sqlite toggle workload on the file-backed test database."""
+
+    def test_concurrent_toggles_without_lock_errors(self):
+        user = User.objects.create_user("stress", password="pw")
+        habit_ids = []
+        for i in range(4):
+            habit = Habit.objects.create(user=user, title=f"Habit {i}")
+            HabitStats.objects.create(habit=habit)
+            habit_ids.append(habit.id)
+
+        counts, _, _ = run_toggles(user, habit_ids, threads=8, toggles=25)
+
+        self.assertEqual(counts, {"ok": 200, "lock_errors": 0, "other_errors": 0})
+        self.assertEqual(rollups.verify(), [])
+        fields = ("habit_id", "longest_streak", "last_run_end", "last_run_length", "longest_earlier")
+        maintained = list(HabitStats.objects.order_by("habit_id").values_list(*fields))
+        streaks.rebuild(user)
+        self.assertEqual(maintained, list(HabitStats.objects.order_by("habit_id").values_list(*fields)))
+
+
+class ApiTestCase(TestCase):
+    """A logged-in user with two habits and an empty response cache."""
+
+    def setUp(self):
+        # cached bodies are keyed by user id, which later tests reuse
+        caches[settings.HABITS_CACHE_ALIAS].clear()
+        self.user = User.objects.create_user("api", password="pw")
+        self.client.force_login(self.user)
+        self.habits = [Habit.objects.create(user=self.user, title=t) for t in ("Run", "Read")]
+        for habit in self.habits:
+            HabitStats.objects.create(habit=habit)
+        self.today = timezone.localdate()
+        self.first = self.today.replace(day=1)
+
+    def toggle(self, habit, date, completed, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/toggle-entry/", {
+                "habit_id": habit.id, "date": date.isoformat(), "completed": str(completed).lower(),
+            }, **extra)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def day(self, n):
+        return self.first + dt.timedelta(days=n - 1)
+
+
+class ToggleTests(ApiTestCase):
+    """A toggle updates the entry, the rollups, the streaks and the responses built on them."""
+
+    def _check(self):
+        for n in (1, 2, 3):
+            response = self.toggle(self.habits[0], self.day(n), True)
+        self.toggle(self.habits[1], self.day(2), True)
+
+        payload = response.json()["habit"]
+        self.assertEqual([d["day"] for d in payload["days"] if d["completed"]], [1, 2, 3])
+        self.assertEqual((payload["completed_count"], payload["longest_streak"]), (3, 3))
+
+        progress = self.client.get("/api/monthly-progress/", {"year": self.today.year, "month": self.today.month}).json()
+        self.assertEqual(progress["counts"][:4], [1, 2, 1, 0])
+        self.assertEqual(progress["percentages"][:4], [50.0, 100.0, 50.0, 0.0])
+        yearly = self.client.get("/api/yearly-progress/", {"year": self.today.year}).json()
+        self.assertEqual(yearly["counts"][self.today.month - 1], 4)
+        self.assertEqual(rollups.verify(), [])
+
+        # breaking the run in the middle leaves two runs of one day
+        self.toggle(self.habits[0], self.day(2), False)
+        streak = {h["id"]: h for h in self.client.get("/api/streaks/").json()["habits"]}[self.habits[0].id]
+        self.assertEqual((streak["longest_streak"], streak["last_completed"]), (1, self.day(3).isoformat()))
+        progress = self.client.get("/api/monthly-progress/", {"year": self.today.year, "month": self.today.month}).json()
+        self.assertEqual(progress["counts"][:4], [1, 1, 1, 0])
+        self.assertEqual(rollups.verify(), [])
+
+    def test_rows(self):
+        self._check()
+
+    @override_settings(HABITS_STORAGE="bitset")
+    def test_bitset(self):
+        self._check()
+
+    def test_past_month_is_read_only(self):
+        response = self.client.post("/api/toggle-entry/", {
+            "habit_id": self.habits[0].id, "date": (self.first - dt.timedelta(days=1)).isoformat(), "completed": "true",
+        })
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(HabitEntry.objects.exists())
+
+
+class PayloadFormatTests(ApiTestCase):
+    """Compact payloads carry the same completion as verbose ones, as a day mask."""
+
+    def setUp(self):
+        super().setUp()
+        for n in (1, 3):
+            self.toggle(self.habits[0], self.day(n), True)
+
+    def _get(self, **kwargs):
+        return self.client.get("/api/habits-for-month/", {"year": self.today.year, "month": self.today.month}, **kwargs)
+
+    def test_verbose_and_compact(self):
+        verbose = self._get()
+        compact = self._get(headers={"Accept": "application/vnd.habits.compact+json"})
+        self.assertIn("Accept", verbose["Vary"])
+        self.assertNotIn(b", ", compact.content)
+        self.assertNotEqual(verbose["ETag"], compact["ETag"])
+
+        habit = verbose.json()["habits"][0]
+        packed = compact.json()["habits"][0]
+        self.assertEqual(packed["mask"], day_bit(1) | day_bit(3))
+        self.assertEqual([d["day"] for d in habit["days"] if d["completed"]], list(mask_days(packed["mask"])))
+        self.assertEqual(
+            {k: v for k, v in habit.items() if k != "days"}, {k: v for k, v in packed.items() if k != "mask"}
+        )
+        self.assertEqual(self.client.get("/api/habits-for-month/", {"format": "compact"}).json(), compact.json())
+
+    def test_compact_toggle_response(self):
+        response = self.toggle(self.habits[0], self.day(2), True, headers={"Accept": "application/vnd.habits.compact+json"})
+        self.assertEqual(response.json()["habit"]["mask"], day_bit(1) | day_bit(2) | day_bit(3))
+
+
+class ResponseCacheTests(ApiTestCase):
+    """ETags, and the cache versions that decide when a cached body is stale."""
+
+    def _progress(self, month=None, **kwargs):
+        month = month or self.first
+        return self.client.get("/api/monthly-progress/", {"year": month.year, "month": month.month}, **kwargs)
+
+    def test_not_modified_until_a_toggle(self):
+        first = self._progress()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self._progress(headers={"If-None-Match": first["ETag"]}).status_code, 304)
+        self.toggle(self.habits[0], self.day(1), True)
+        changed = self._progress(headers={"If-None-Match": first["ETag"]})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+        self.assertEqual(changed.json()["counts"][0], 1)
+
+    def test_past_months_only_follow_the_habits_version(self):
+        past = self.first - dt.timedelta(days=1)
+        before = self._progress(past).json()
+        # rollups written behind the cache's back, as a management command would
+        rollups.record_change(self.user.id, past, False, True)
+        with self.captureOnCommitCallbacks(execute=True):
+            caching.bump(self.user.id, caching.ENTRIES)
+        self.assertEqual(self._progress(past).json(), before)
+        with self.captureOnCommitCallbacks(execute=True):
+            caching.bump(self.user.id, caching.HABITS)
+        self.assertEqual(self._progress(past).json()["counts"][past.day - 1], 1)
+
+    @override_settings(HABITS_CACHE_TIMEOUT=30, HABITS_CACHE_PAST_TIMEOUT=600)
+    def test_timeouts(self):
+        past = self.first - dt.timedelta(days=1)
+        with mock.patch.object(caches[settings.HABITS_CACHE_ALIAS], "set") as cache_set:
+            self._progress()
+            self._progress(past)
+        timeouts = [c.args[2] for c in cache_set.call_args_list if c.args[0].startswith("habits:r:")]
+        self.assertEqual(timeouts, [30, 600])
+
+    def test_bump_all(self):
+        before = self._progress().json()
+        rollups.record_change(self.user.id, self.day(1), False, True)
+        self.assertEqual(self._progress().json(), before)
+        with self.captureOnCommitCallbacks(execute=True):
+            caching.bump_all()
+        self.assertEqual(self._progress().json()["counts"][0], 1)
+
+
+class SyncTests(ApiTestCase):
+    """Paging through /api/sync/ and the deletions it reports."""
+
+    def _sync_all(self, cursor=None, limit=2):
+        habits, entries, deleted = {}, set(), []
+        for _ in range(50):
+            params = {"limit": limit}
+            if cursor:
+                params["cursor"] = cursor
+            data = self.client.get("/api/sync/", params).json()
+            habits.update((h["id"], h["title"]) for h in data["habits"])
+            entries.update((e["habit_id"], e["date"]) for e in data["entries"] if e["completed"])
+            deleted += data["deleted"]
+            cursor = data["cursor"]
+            if not data["has_more"]:
+                return habits, entries, deleted, cursor
+        self.fail("sync did not finish paging")
+
+    def test_paging_and_tombstones(self):
+        for n in (1, 2, 3):
+            self.toggle(self.habits[0], self.day(n), True)
+        self.toggle(self.habits[1], self.day(1), True)
+        habits, entries, deleted, cursor = self._sync_all()
+        self.assertEqual(habits, {h.id: h.title for h in self.habits})
+        self.assertEqual(entries, {(h.id, self.day(n).isoformat()) for h, n in
+                                   [(self.habits[0], 1), (self.habits[0], 2), (self.habits[0], 3), (self.habits[1], 1)]})
+        self.assertEqual(deleted, [])
+
+        self.toggle(self.habits[0], self.day(2), False)
+        removed = self.habits[1].id
+        self.habits[1].delete()
+        _, _, deleted, cursor = self._sync_all(cursor)
+        self.assertCountEqual(deleted, [
+            {"type": "entry", "habit_id": self.habits[0].id, "date": self.day(2).isoformat()},
+            {"type": "habit", "id": removed},
+        ])
+
+        # completing the day again takes its tombstone back
+        self.toggle(self.habits[0], self.day(2), True)
+        _, entries, deleted, _ = self._sync_all()
+        self.assertIn((self.habits[0].id, self.day(2).isoformat()), entries)
+        self.assertEqual(deleted, [{"type": "habit", "id": removed}])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/api/sync/", {"cursor": "not-a-cursor"}).status_code, 400)
+
+    def test_naive_cursor_timestamp(self):
+        naive = sync.encode_cursor({"e": (dt.datetime(2026, 1, 1), 1)})
+        self.assertRaises(sync.InvalidCursor, sync.decode_cursor, naive)
+        self.assertEqual(self.client.get("/api/sync/", {"cursor": naive}).status_code, 400)
+        aware = sync.encode_cursor({"e": (dt.datetime(2026, 1, 1, tzinfo=dt.timezone.utc), 1)})
+        self.assertEqual(self.client.get("/api/sync/", {"cursor": aware}).status_code, 200)
+
+
+class BitsetStorageTests(ApiTestCase):
+    """Day masks, and the bitset storage agreeing with the row storage."""
+
+    def test_mask_helpers(self):
+        self.assertEqual(day_bit(1), 1)
+        self.assertEqual(day_bit(31), 1 << 30)
+        self.assertEqual(list(mask_days(day_bit(2) | day_bit(5) | day_bit(31))), [2, 5, 31])
+        self.assertEqual(list(mask_days(0)), [])
+
+    def test_storages_agree(self):
+        rows, bits = RowStorage(), BitsetStorage()
+        changes = {(self.habits[0].id, self.day(n)): True for n in (1, 2, 5)}
+        changes[(self.habits[1].id, self.day(28))] = True
+        for storage in (rows, bits):
+            previous = storage.set_many(self.user, changes)
+            self.assertEqual(set(previous.values()), {False})
+            self.assertTrue(storage.set_completed(self.user, self.habits[0], self.day(2), False))
+            self.assertFalse(storage.set_completed(self.user, self.habits[0], self.day(2), False))
+
+        mask = HabitMonth.objects.get(habit=self.habits[0], year=self.today.year, month=self.today.month).mask
+        self.assertEqual(mask, day_bit(1) | day_bit(5))
+        ids = [h.id for h in self.habits]
+        self.assertEqual(
+            rows.month_masks(self.user, self.today.year, self.today.month, ids),
+            bits.month_masks(self.user, self.today.year, self.today.month, ids),
+        )
+        self.assertEqual(
+            list(rows.iter_completed_dates(self.habits[0].id)), list(bits.iter_completed_dates(self.habits[0].id))
+        )
+        self.assertEqual(
+            list(bits.iter_completed_dates(self.habits[0].id, end=self.day(4), descending=True)), [self.day(1)]
+        )
+        self.assertEqual(rows.completion_counts(self.user), bits.completion_counts(self.user))
+
+
+class BackfillTests(TestCase):
+    """Batched backfills checkpoint after every batch and resume from there."""
+
+    def setUp(self):
+        user = User.objects.create_user("filler", password="pw")
+        habit = Habit.objects.create(user=user, title="Run")
+        start = dt.date(2024, 1, 1)
+        HabitEntry.objects.bulk_create([
+            HabitEntry(user=user, habit=habit, date=start + dt.timedelta(days=i), completed=True) for i in range(10)
+        ])
+        self.stamp = timezone.now() - dt.timedelta(days=1)
+
+    def _checkpoint(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT last_pk FROM %s WHERE name = %%s" % CHECKPOINT_TABLE, [name])
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def test_resumes_after_interruption(self):
+        pks = list(HabitEntry.objects.order_by("pk").values_list("pk", flat=True))
+
+        def interrupt(name, updated, last_pk, max_pk):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            backfill(HabitEntry, "test-stamp", {"updated_at": self.stamp}, batch_size=4, report=interrupt)
+        self.assertEqual(self._checkpoint("test-stamp"), pks[3])
+        self.assertEqual(HabitEntry.objects.filter(updated_at=self.stamp).count(), 4)
+
+        batches = []
+        updated = backfill(
+            HabitEntry, "test-stamp", {"updated_at": self.stamp}, batch_size=4,
+            report=lambda name, updated, last_pk, max_pk: batches.append((updated, last_pk)),
+        )
+        self.assertEqual(updated, 6)
+        self.assertEqual(batches, [(4, pks[7]), (6, pks[9])])
+        self.assertEqual(HabitEntry.objects.filter(updated_at=self.stamp).count(), 10)
+        self.assertIsNone(self._checkpoint("test-stamp"))
+
+    def test_filter_and_expressions(self):
+        HabitEntry.objects.filter(pk__in=HabitEntry.objects.order_by("pk").values("pk")[:3]).update(completed=False)
+        updated = backfill(
+            HabitEntry, "test-flip", {"completed": ~F("completed")}, filter=Q(completed=False), batch_size=2, report=None
+        )
+        self.assertEqual(updated, 3)
+        self.assertFalse(HabitEntry.objects.filter(completed=False).exists())
+
+
+class ConvertStorageTests(ApiTestCase):
+    """Converting makes the target an exact copy of the source, unchecked days included."""
+
+    def _convert(self, to):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("convert_storage", "--to", to, stdout=io.StringIO())
+
+    def _completed(self, storage):
+        return list(storage.iter_completed_dates(self.habits[0].id))
+
+    def test_round_trip_keeps_unchecked_days_unchecked(self):
+        for n in (1, 2, 3):
+            self.toggle(self.habits[0], self.day(n), True)
+        self._convert("bitset")
+        with override_settings(HABITS_STORAGE="bitset"):
+            # uncheck a day, and a whole month, while running on bitsets
+            self.toggle(self.habits[0], self.day(2), False)
+            self.toggle(self.habits[1], self.day(5), True)
+            self.toggle(self.habits[1], self.day(5), False)
+            self._convert("rows")
+        self.assertEqual(self._completed(RowStorage()), [self.day(1), self.day(3)])
+        self.assertEqual(list(RowStorage().iter_completed_dates(self.habits[1].id)), [])
+        self.assertTrue(Tombstone.objects.filter(key=f"{self.habits[0].id}:{self.day(2).isoformat()}").exists())
+        self.assertEqual(rollups.verify(), [])
+
+        # and back: the month emptied on rows is emptied on bitsets too
+        self.toggle(self.habits[0], self.day(1), False)
+        self.toggle(self.habits[0], self.day(3), False)
+        self._convert("bitset")
+        self.assertEqual(self._completed(BitsetStorage()), [])
+        self.assertEqual(set(HabitMonth.objects.values_list("mask", flat=True)), {0})
+
+    def test_rebuilds_rollups_streaks_and_cache(self):
+        self.toggle(self.habits[0], self.day(1), True)
+        before = self.client.get("/api/streaks/").json()
+        # a day written behind the app's back
+        HabitEntry.objects.create(user=self.user, habit=self.habits[0], date=self.day(2), completed=True)
+        self._convert("bitset")
+        self.assertEqual(rollups.verify(), [])
+        self.assertEqual(DailyRollup.objects.get(user=self.user, date=self.day(2)).completed_count, 1)
+        self.assertEqual(HabitStats.objects.get(habit=self.habits[0]).longest_streak, 2)
+        self.assertNotEqual(self.client.get("/api/streaks/").json(), before)
+
+
+class HeatmapTests(ApiTestCase):
+
+    def test_encoded_year(self):
+        for n in (1, 3):
+            self.toggle(self.habits[0], self.day(n), True)
+        data = self.client.get("/api/heatmap/", {"year": self.today.year}).json()
+        self.assertEqual((data["year"], data["encoding"]), (self.today.year, ENCODING))
+        self.assertEqual(data["days"], (dt.date(self.today.year, 12, 31) - dt.date(self.today.year, 1, 1)).days + 1)
+        habit = {h["id"]: h for h in data["habits"]}[self.habits[0].id]
+        bits = int.from_bytes(base64.b64decode(habit["bits"]), "little")
+        offset = self.first.timetuple().tm_yday - 1
+        self.assertEqual(bits, (1 << offset) | (1 << (offset + 2)))
+        self.assertEqual(habit["completed_count"], 2)
+
+    def test_invalid_years(self):
+        for year in ("0", "-5", "10000", "soon"):
+            response = self.client.get("/api/heatmap/", {"year": year})
+            self.assertEqual(response.status_code, 400, year)
+            self.assertEqual(response.json(), {"error": "invalid year"})
+
+
+class SearchTests(ApiTestCase):
+    """Journal search through the FTS5 index its triggers keep in sync."""
+
+    def write(self, n, text):
+        return JournalEntry.objects.update_or_create(user=self.user, date=self.day(n), defaults={"text": text})[0]
+
+    def dates(self, query, **kwargs):
+        return [date for date, _ in search.search(self.user, query, **kwargs)]
+
+    def test_triggers_follow_writes(self):
+        entry = self.write(1, "A long walk by the river")
+        self.assertEqual(self.dates("river"), [str(self.day(1))])
+        self.write(1, "Rain all day, stayed inside")
+        self.assertEqual(self.dates("river"), [])
+        self.assertEqual(self.dates("rain"), [str(self.day(1))])
+        entry.delete()
+        self.assertEqual(self.dates("rain"), [])
+
+    def test_prefix_and_highlight(self):
+        self.write(1, "Swimming <b>laps</b>")
+        [(date, snippet)] = search.search(self.user, "swim")
+        self.assertEqual(date, str(self.day(1)))
+        self.assertEqual(snippet, "<mark>Swimming</mark> &lt;b&gt;laps&lt;/b&gt;")
+
+    def test_ranking(self):
+        self.write(1, "Tea in the morning, then work")
+        self.write(2, "Tea, more tea, and tea again")
+        self.write(3, "No drinks today at all, only work")
+        self.assertEqual(self.dates("tea"), [str(self.day(2)), str(self.day(1))])
+
+    def test_operators_and_quotes_are_words(self):
+        self.write(1, 'She said "AND" or NEAR it, o\'clock')
+        self.write(2, "Nothing to see here")
+        for query in ('AND', 'NEAR(said', '"said', "o'clock", 'said* OR', '-she', '{said}: "and" ^near'):
+            self.assertEqual(self.dates(query), [str(self.day(1))], query)
+        self.assertEqual(self.dates('*'), [])
+
+    def test_paging(self):
+        for n in (1, 2, 3):
+            self.write(n, "Garden work")
+        newest_first = [str(self.day(n)) for n in (3, 2, 1)]
+        self.assertEqual(self.dates("garden", limit=2), newest_first[:2])
+        self.assertEqual(self.dates("garden", limit=2, offset=2), newest_first[2:])
+        first = self.client.get("/api/journal/search/", {"q": "garden", "limit": 2}).json()
+        self.assertEqual(([r["date"] for r in first["results"]], first["has_more"]), (newest_first[:2], True))
+        last = self.client.get("/api/journal/search/", {"q": "garden", "limit": 2, "offset": 2}).json()
+        self.assertEqual(([r["date"] for r in last["results"]], last["has_more"]), (newest_first[2:], False))
+
+    def test_pg_query(self):
+        self.assertEqual(search._pg_query(["and", "o", "clo"]), "'and' & 'o' & 'clo':*")
+        self.assertEqual(search._pg_query(["it's", "a\\b"]), "'it''s' & 'a\\\\b':*")
@@ -0,0 +1,62 @@
+"""Deletion markers read by the sync API.
+
+A deleted habit, journal entry or (in ``rows`` storage) un-completed
+``HabitEntry`` leaves a :class:`~habits.models.Tombstone` so that clients
+syncing from an older cursor learn about it. Re-creating the record removes
+its tombstone again, so a key is never both present and deleted.
+Bitset storage reports un-completed days through the month rows themselves
+and does not write entry tombstones.
+"""
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+
+from .models import Habit, JournalEntry, Tombstone
+
+
+def entry_key(habit_id, date):
+    return f"{habit_id}:{date.isoformat()}"
+
+
+def record(user_id, kind, keys):
+    """Mark ``keys`` of ``kind`` as deleted now (one upsert)."""
+    if keys:
+        Tombstone.objects.bulk_create(
+            [Tombstone(user_id=user_id, kind=kind, key=key) for key in keys],
+            update_conflicts=True, unique_fields=["user", "kind", "key"], update_fields=["deleted_at"],
+        )
+
+
+def clear(user_id, kind, keys):
+    """Drop the tombstones of re-created ``keys`` (one delete)."""
+    if keys:
+        Tombstone.objects.filter(user_id=user_id, kind=kind, key__in=keys).delete()
+
+
+def _user_deleted(origin):
+    # deleting a user cascades to its tombstones; don't write new ones
+    return (origin.model if isinstance(origin, QuerySet) else type(origin)) is User
+
+
+def _habit_deleted(sender, instance, origin=None, **kwargs):
+    if _user_deleted(origin):
+        return
+    # the habit's entries go with it; clients drop them with the habit
+    record(instance.user_id, Tombstone.HABIT, [str(instance.pk)])
+
+
+def _journal_deleted(sender, instance, origin=None, **kwargs):
+    if _user_deleted(origin):
+        return
+    record(instance.user_id, Tombstone.JOURNAL, [instance.date.isoformat()])
+
+
+def _journal_saved(sender, instance, created, **kwargs):
+    if created:
+        clear(instance.user_id, Tombstone.JOURNAL, [instance.date.isoformat()])
+
+
+def connect():
+    post_delete.connect(_habit_deleted, sender=Habit, dispatch_uid="habits.tombstones.habit")
+    post_delete.connect(_journal_deleted, sender=JournalEntry, dispatch_uid="habits.tombstones.journal")
+    post_save.connect(_journal_saved, sender=JournalEntry, dispatch_uid="habits.tombstones.journal_saved")
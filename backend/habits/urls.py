@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, instrumentation, views
 
 urlpatterns = [
     path("", views.home, name="home"),
@@ -10,8 +10,21 @@ urlpatterns = [
     path("toggle/<int:id>/", views.toggle_habit, name="toggle_habit"),
     path("api/monthly-progress/", views.monthly_progress, name="monthly_progress"),
     path("api/yearly-progress/", views.yearly_progress, name="yearly_progress"),
+    path("api/heatmap/", views.api_heatmap, name="api_heatmap"),
     path("api/habits-for-month/", views.habits_for_month, name="habits_for_month"),
     path("api/toggle-entry/", views.api_toggle_entry, name="api_toggle_entry"),
+    path("api/toggle-entries/", views.api_toggle_entries, name="api_toggle_entries"),
     path("api/journal/", views.api_journal, name="api_journal"),
+    path("api/journal/search/", views.api_journal_search, name="api_journal_search"),
+    path("api/journal/month/", views.api_journal_month, name="api_journal_month"),
+    path("api/streaks/", views.api_streaks, name="api_streaks"),
+    path("api/export/", views.api_export, name="api_export"),
+    path("api/sync/", views.api_sync, name="api_sync"),
+    path("api/events/", async_views.api_events, name="api_events"),
+    path("api/async/monthly-progress/", async_views.monthly_progress, name="async_monthly_progress"),
+    path("api/async/yearly-progress/", async_views.yearly_progress, name="async_yearly_progress"),
+    path("api/async/habits-for-month/", async_views.habits_for_month, name="async_habits_for_month"),
+    path("api/async/journal/", async_views.api_journal, name="async_api_journal"),
+    path("metrics/", instrumentation.metrics_view, name="metrics"),
     
 ]
@@ -1,26 +1,51 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
-from .models import Habit, HabitEntry, JournalEntry
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from .models import Habit, HabitStats, JournalEntry
+from . import aggregation, caching, events, export, heatmap, payloads, rollups, search, streaks, sync
+from .storage import get_backend
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.db.models.functions import Length, Substr
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 import calendar
 import datetime as dt
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def _today_date():
     return timezone.localdate()
 
 
+COMPACT_MEDIA_TYPE = 'application/vnd.habits.compact+json'
+
+
+def _wants_compact(request, data=None):
+    """True for `?format=compact`, a `format` field in `data`, or the compact Accept type."""
+    fmt = request.GET.get('format') or (data.get('format') if isinstance(data, dict) else None)
+    if fmt:
+        return fmt == 'compact'
+    return COMPACT_MEDIA_TYPE in request.META.get('HTTP_ACCEPT', '')
+
+
+def _compact_json(data, status=200):
+    return HttpResponse(caching.dumps(data, compact=True), content_type="application/json", status=status)
+
+
+def _as_bool(value):
+    # normalize string values sent by forms / loosely typed clients
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
 @login_required
 def home(request):
-    habits = Habit.objects.filter(user=request.user)
-    today = _today_date()
-    entries = HabitEntry.objects.filter(habit__in=habits, date=today)
-    today_map = {e.habit_id: e.completed for e in entries}
-    # attach today's state to habit instances for template convenience
-    for h in habits:
-        h.today_completed = today_map.get(h.id, False)
-    return render(request, "home.html", {"habits": habits, "today_map": today_map})
+    # the habit list is rendered by the frontend from the JSON APIs
+    return render(request, "home.html", {})
 
 
 @login_required
@@ -43,7 +68,10 @@ def habits_page(request):
 def add_habit(request):
     if request.method == "POST":
         title = request.POST['title']
-        Habit.objects.create(user=request.user, title=title)
+        habit = Habit.objects.create(user=request.user, title=title)
+        HabitStats.objects.create(habit=habit)
+        caching.bump(request.user.id, caching.HABITS)
+        events.publish(request.user.id, "habit", events.client_id(request), id=habit.id, title=habit.title)
         return redirect("home")
     return render(request, "add_habit.html")
 
@@ -52,14 +80,15 @@ def add_habit(request):
 def toggle_habit(request, id):
     habit = get_object_or_404(Habit, id=id, user=request.user)
     today = _today_date()
-    try:
-        entry, created = HabitEntry.objects.get_or_create(habit=habit, date=today, defaults={"completed": True, "user": request.user})
-    except Exception:
-        # fallback: create and ensure save() sets user
-        entry, created = HabitEntry.objects.get_or_create(habit=habit, date=today, defaults={"completed": True})
-    if not created:
-        entry.completed = not entry.completed
-        entry.save()
+    storage = get_backend()
+    with transaction.atomic():
+        completed = not storage.is_completed(request.user, habit, today)
+        # the stored state may have changed since the read; count from what was replaced
+        was_completed = storage.set_completed(request.user, habit, today, completed)
+        rollups.record_change(request.user.id, today, was_completed, completed)
+        streaks.record_change(habit.id, today, was_completed, completed)
+        caching.bump(request.user.id, caching.ENTRIES)
+        events.publish(request.user.id, "entry", habit_id=habit.id, date=today.isoformat(), completed=completed)
     return redirect("home")
 
 
@@ -74,22 +103,10 @@ def monthly_progress(request):
     except (TypeError, ValueError):
         year = today.year
         month = today.month
-    _, ndays = calendar.monthrange(year, month)
-    total_habits = Habit.objects.filter(user=user).count() or 0
-    days = []
-    counts = []
-    percentages = []
-    labels = []
-    for day in range(1, ndays + 1):
-        d = dt.date(year, month, day)
-        # use denormalized `user` column for faster lookup (avoids JOIN to Habit)
-        cnt = HabitEntry.objects.filter(user=user, date=d, completed=True).count()
-        pct = round((cnt / total_habits * 100) if total_habits else 0, 1)
-        days.append(day)
-        counts.append(cnt)
-        percentages.append(pct)
-        labels.append(d.isoformat())
-    return JsonResponse({"days": days, "counts": counts, "percentages": percentages, "labels": labels})
+    return caching.json_response(
+        request, "monthly_progress", (year, month), caching.month_scopes(year, month, today),
+        lambda: aggregation.month_progress(user, year, month),
+    )
 
 
 @login_required
@@ -100,20 +117,27 @@ def yearly_progress(request):
         year = int(request.GET.get('year', today.year))
     except (TypeError, ValueError):
         year = today.year
-    monthly_counts = []
-    monthly_pct = []
-    labels = []
-    total_habits = Habit.objects.filter(user=user).count() or 0
-    for month in range(1, 13):
-        _, ndays = calendar.monthrange(year, month)
-        start = dt.date(year, month, 1)
-        end = dt.date(year, month, ndays)
-        cnt = HabitEntry.objects.filter(user=user, date__gte=start, date__lte=end, completed=True).count()
-        pct = round((cnt / (total_habits * ndays) * 100) if total_habits else 0, 1)
-        monthly_counts.append(cnt)
-        monthly_pct.append(pct)
-        labels.append(f"{year}-{month:02d}")
-    return JsonResponse({"months": labels, "counts": monthly_counts, "percentages": monthly_pct})
+    return caching.json_response(
+        request, "yearly_progress", (year,), caching.year_scopes(year, today),
+        lambda: aggregation.year_progress(user, year),
+    )
+
+
+@login_required
+def api_heatmap(request):
+    """Every day of a year for all of the user's habits, as compact bitstrings."""
+    user = request.user
+    today = _today_date()
+    try:
+        year = int(request.GET.get('year', today.year))
+        if not dt.MINYEAR <= year <= dt.MAXYEAR:
+            raise ValueError(year)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "invalid year"}, status=400)
+    return caching.json_response(
+        request, "heatmap", (year,), caching.year_scopes(year, today),
+        lambda: heatmap.year_heatmap(user, year),
+    )
 
 
 @login_required
@@ -128,39 +152,23 @@ def habits_for_month(request):
         year = today.year
         month = today.month
 
-    _, ndays = calendar.monthrange(year, month)
-    out = []
-
-    habits = Habit.objects.filter(user=user)
-    for h in habits:
-        # 1️⃣ Query existing entries for month
-        entries = HabitEntry.objects.filter(habit=h, date__year=year, date__month=month)
-        entry_map = {e.date.day: e.completed for e in entries}
-
-        # Only create if really missing, but don't overwrite anything
-        if year == today.year and month == today.month and today.day not in entry_map:
-            e = HabitEntry.objects.create(habit=h, date=today, completed=False, user=user)
-            entry_map[today.day] = e.completed
-
-        # 3️⃣ Build per-day list
-        days = []
-        completed_count = 0
-        for d in range(1, ndays + 1):
-            completed = entry_map.get(d, False)
-            days.append({"day": d, "completed": completed})
-            if completed:
-                completed_count += 1
-
-        pct = round((completed_count / ndays * 100), 1) if ndays else 0
-        out.append({
-            "id": h.id,
-            "title": h.title,
-            "days": days,
-            "completed_count": completed_count,
-            "percentage": pct
-        })
-
-    return JsonResponse({"habits": out, "ndays": ndays})
+    # streaks are only included for the current month; they change with the day,
+    # which would defeat caching the (otherwise immutable) past months
+    current = (year, month) == (today.year, today.month)
+
+    compact = _wants_compact(request)
+
+    def build():
+        _, ndays = calendar.monthrange(year, month)
+        out = payloads.month_payloads(user, year, month, today=today, with_streaks=current, compact=compact)
+        return {"habits": out, "ndays": ndays}
+
+    params = (year, month, today.isoformat()) if current else (year, month)
+    response = caching.json_response(
+        request, "habits_for_month", params, caching.month_scopes(year, month, today), build, compact=compact
+    )
+    patch_vary_headers(response, ['Accept'])
+    return response
 
 
 @login_required
@@ -180,10 +188,12 @@ def api_journal(request):
                 return JsonResponse({"error": "invalid date"}, status=400)
         else:
             d = _today_date()
-        entries = JournalEntry.objects.filter(user=user, date=d)
-        if entries.exists():
-            return JsonResponse({"date": d.isoformat(), "text": entries.first().text})
-        return JsonResponse({"date": d.isoformat(), "text": ""})
+
+        def build():
+            text = JournalEntry.objects.filter(user=user, date=d).values_list("text", flat=True).first()
+            return {"date": d.isoformat(), "text": text or ""}
+
+        return caching.json_response(request, "journal", (d.isoformat(),), (caching.JOURNAL,), build)
 
     if request.method == 'POST':
         try:
@@ -201,29 +211,90 @@ def api_journal(request):
         else:
             d = _today_date()
         entry, created = JournalEntry.objects.update_or_create(user=user, date=d, defaults={"text": text})
+        caching.bump(user.id, caching.JOURNAL)
+        events.publish(user.id, "journal", events.client_id(request), date=d.isoformat())
         return JsonResponse({"date": d.isoformat(), "text": entry.text})
 
 
+# characters of each entry returned by the journal month listing
+JOURNAL_PREVIEW_LENGTH = 80
+
+
+@login_required
+def api_journal_month(request):
+    """Days of `?year=&month=` that have a journal entry, with its length and a short preview.
+
+    Only the first `JOURNAL_PREVIEW_LENGTH` characters are read from the
+    database, so long entries cost no more than short ones.
+    """
+    today = _today_date()
+    try:
+        year = int(request.GET.get('year', today.year))
+        month = int(request.GET.get('month', today.month))
+        _, ndays = calendar.monthrange(year, month)
+        start, end = dt.date(year, month, 1), dt.date(year, month, ndays)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "invalid year or month"}, status=400)
+
+    def build():
+        entries = (
+            JournalEntry.objects.filter(user=request.user, date__gte=start, date__lte=end)
+            .exclude(text="")
+            .order_by("date")
+            .values_list("date", Length("text"), Substr("text", 1, JOURNAL_PREVIEW_LENGTH))
+        )
+        return {
+            "year": year,
+            "month": month,
+            "entries": [
+                {"date": date.isoformat(), "length": length, "preview": preview}
+                for date, length, preview in entries
+            ],
+        }
+
+    return caching.json_response(request, "journal_month", (year, month), (caching.JOURNAL,), build)
+
+
+# page size bounds for the journal search
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 50
+
+
+@login_required
+def api_journal_search(request):
+    """Journal entries matching `?q=`, best match first, with `<mark>`-highlighted snippets.
+
+    Pages with `?offset=` and `?limit=`; `has_more` tells whether another page exists.
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', SEARCH_PAGE_SIZE)), 1), MAX_SEARCH_PAGE_SIZE)
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "invalid limit or offset"}, status=400)
+    if not search.terms(query):
+        return JsonResponse({"error": "`q` must contain at least one word"}, status=400)
+
+    def build():
+        rows = search.search(request.user, query, limit=limit + 1, offset=offset)
+        return {
+            "query": query,
+            "results": [{"date": date, "snippet": snippet} for date, snippet in rows[:limit]],
+            "offset": offset,
+            "has_more": len(rows) > limit,
+        }
+
+    # free text is hashed to keep cache keys short and free of spaces
+    key = hashlib.sha1(query.encode()).hexdigest()
+    return caching.json_response(request, "journal_search", (key, limit, offset), (caching.JOURNAL,), build)
+
+
 @login_required
 def api_toggle_entry(request):
     """Toggle a habit entry for a specific date. Only allow toggling within the current month/year."""
     if request.method != "POST":
         return JsonResponse({"error": "POST required"}, status=405)
     user = request.user
-    # log incoming raw body for debugging
-    try:
-        raw_body = request.body.decode()
-        print(f"[api_toggle_entry] raw_body={raw_body}")
-    except Exception:
-        raw_body = None
-    # Also log request meta for correlation (client request id, ua, ip)
-    try:
-        header_req_id = request.META.get('HTTP_X_REQUEST_ID')
-        ua = request.META.get('HTTP_USER_AGENT')
-        ip = request.META.get('REMOTE_ADDR')
-        print(f"[api_toggle_entry] header_request_id={header_req_id} ua={ua} remote_addr={ip}")
-    except Exception:
-        pass
     data = request.POST or request.POST.copy()
     # support JSON body
     if not data:
@@ -254,63 +325,199 @@ def api_toggle_entry(request):
     if not (d.year == today.year and d.month == today.month):
         return JsonResponse({"error": "Editing previous months is not allowed"}, status=403)
 
-    try:
-        entry, created = HabitEntry.objects.get_or_create(habit=habit, date=d, defaults={"completed": True, "user": user})
-    except Exception as e:
-        # try fallback to allow save() to populate user, but return clear error if it still fails
-        try:
-            entry, created = HabitEntry.objects.get_or_create(habit=habit, date=d, defaults={"completed": True})
-        except Exception as e2:
-            return JsonResponse({"error": "failed to toggle entry", "detail": str(e2)}, status=500)
     # Require explicit `completed` value from client to avoid toggle races.
     if isinstance(data, dict) and 'completed' in data:
-        # capture any client-supplied request id for debugging
-        request_id = data.get('request_id') or None
-        if request_id:
-            try:
-                print(f"[api_toggle_entry] request_id={request_id}")
-            except Exception:
-                pass
-        completed_val = data.get('completed')
-        # normalize string values
-        if isinstance(completed_val, str):
-            completed_val = completed_val.lower() in ('1', 'true', 'yes', 'on')
-        else:
-            completed_val = bool(completed_val)
+        completed_val = _as_bool(data.get('completed'))
     else:
         return JsonResponse({"error": "`completed` parameter is required"}, status=400)
 
-    # Set the explicit state idempotently
-    entry.completed = completed_val
-    entry.user = entry.user or user
-    entry.save()
+    try:
+        with transaction.atomic():
+            was_completed = get_backend().set_completed(user, habit, d, completed_val)
+            rollups.record_change(user.id, d, was_completed, completed_val)
+            streaks.record_change(habit.id, d, was_completed, completed_val)
+            caching.bump(user.id, caching.ENTRIES)
+            events.publish(
+                user.id, "entry", events.client_id(request), habit_id=habit.id, date=d.isoformat(), completed=completed_val
+            )
+    except Exception as e:
+        return JsonResponse({"error": "failed to toggle entry", "detail": str(e)}, status=500)
     # Build authoritative habit payload for the month containing `d`
     try:
-        year = d.year
-        month = d.month
-        _, ndays = calendar.monthrange(year, month)
-        entries = HabitEntry.objects.filter(habit=habit, date__year=year, date__month=month)
-        entry_map = {e.date.day: e.completed for e in entries}
-        days = []
-        completed_count = 0
-        for day in range(1, ndays + 1):
-            completed = bool(entry_map.get(day, False))
-            days.append({"day": day, "completed": completed})
-            if completed:
-                completed_count += 1
-        pct = round((completed_count / ndays * 100), 1) if ndays else 0
-        habit_payload = {"id": habit.id, "title": habit.title, "days": days, "completed_count": completed_count, "percentage": pct}
+        habit_payload = payloads.month_payloads(
+            user, d.year, d.month, habits=[habit], with_streaks=True, compact=_wants_compact(request, data)
+        )[0]
     except Exception:
         habit_payload = None
 
-    # diagnostic log for debugging toggle behavior
-    try:
-        print(f"[api_toggle_entry] user={user.id} habit={habit.id} date={d.isoformat()} created={created} completed={entry.completed}")
-    except Exception:
-        pass
+    # diagnostic log for debugging toggle behavior (client request ids for correlation)
+    logger.debug(
+        "api_toggle_entry user=%s habit=%s date=%s was_completed=%s completed=%s request_id=%s header_request_id=%s",
+        user.id, habit.id, d, was_completed, completed_val,
+        data.get('request_id'), request.META.get('HTTP_X_REQUEST_ID'),
+    )
 
-    resp = {"habit_id": habit.id, "date": d.isoformat(), "completed": entry.completed}
+    resp = {"habit_id": habit.id, "date": d.isoformat(), "completed": completed_val}
     if habit_payload is not None:
         resp["habit"] = habit_payload
+    if _wants_compact(request, data):
+        return _compact_json(resp)
     return JsonResponse(resp)
 
+
+@login_required
+def api_streaks(request):
+    """Current and longest streak for each of the user's habits."""
+    today = _today_date()
+
+    def build():
+        habits = list(Habit.objects.filter(user=request.user).select_related("stats"))
+        out = []
+        for h in habits:
+            stats = getattr(h, "stats", None)
+            out.append({
+                "id": h.id,
+                "title": h.title,
+                "current_streak": stats.current_streak(today) if stats else 0,
+                "longest_streak": stats.longest_streak if stats else 0,
+                "last_completed": stats.last_run_end.isoformat() if stats and stats.last_run_end else None,
+            })
+        return {"habits": out}
+
+    return caching.json_response(
+        request, "streaks", (today.isoformat(),), (caching.ENTRIES, caching.HABITS), build
+    )
+
+
+@login_required
+def api_export(request):
+    """Stream the user's habits, entries and journal as NDJSON (default) or CSV.
+
+    `?year=YYYY` limits entries and journal to one year; all history otherwise.
+    """
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in export.FORMATS:
+        return JsonResponse({"error": "format must be one of: " + ", ".join(export.FORMATS)}, status=400)
+    year = request.GET.get('year')
+    if year:
+        try:
+            year = int(year)
+        except (TypeError, ValueError):
+            return JsonResponse({"error": "invalid year"}, status=400)
+    else:
+        year = None
+    records = export.iter_records(request.user, year)
+    response = StreamingHttpResponse(export.iter_encoded(fmt, records), content_type=export.CONTENT_TYPES[fmt])
+    filename = "habits-%s.%s" % (year or "all", fmt)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+# upper bound on operations accepted by one bulk toggle request
+MAX_BULK_OPERATIONS = 500
+
+
+@login_required
+def api_toggle_entries(request):
+    """Apply many `{habit_id, date, completed}` operations in one request.
+
+    Expects a JSON body `{"operations": [...]}` (or a bare list). The batch is
+    validated as a whole (ownership, dates, current-month rule) and then
+    written in one transaction; later operations on the same habit/date win.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST required"}, status=405)
+    user = request.user
+    try:
+        import json
+        data = json.loads(request.body.decode())
+    except Exception:
+        return JsonResponse({"error": "JSON body required"}, status=400)
+    operations = data.get('operations') if isinstance(data, dict) else data
+    if not isinstance(operations, list) or not operations:
+        return JsonResponse({"error": "`operations` must be a non-empty list"}, status=400)
+    if len(operations) > MAX_BULK_OPERATIONS:
+        return JsonResponse({"error": f"at most {MAX_BULK_OPERATIONS} operations per request"}, status=400)
+
+    today = _today_date()
+    changes = {}
+    for i, op in enumerate(operations):
+        if not isinstance(op, dict):
+            return JsonResponse({"error": f"operation {i} must be an object"}, status=400)
+        try:
+            habit_id = int(op.get('habit_id') or op.get('id'))
+        except (TypeError, ValueError):
+            return JsonResponse({"error": f"operation {i}: habit_id required"}, status=400)
+        if 'completed' not in op:
+            return JsonResponse({"error": f"operation {i}: `completed` parameter is required"}, status=400)
+        date_str = op.get('date')
+        if date_str:
+            try:
+                d = dt.date.fromisoformat(date_str)
+            except Exception:
+                return JsonResponse({"error": f"operation {i}: invalid date format, use YYYY-MM-DD"}, status=400)
+        else:
+            d = today
+        if not (d.year == today.year and d.month == today.month):
+            return JsonResponse({"error": "Editing previous months is not allowed"}, status=403)
+        changes[(habit_id, d)] = _as_bool(op.get('completed'))
+
+    habits = {h.id: h for h in Habit.objects.filter(user=user, id__in={hid for hid, _ in changes})}
+    if len(habits) != len({hid for hid, _ in changes}):
+        return JsonResponse({"error": "habit not found"}, status=404)
+
+    try:
+        with transaction.atomic():
+            previous = get_backend().set_many(user, changes)
+            rollups.record_changes(user.id, {key: (previous[key], completed) for key, completed in changes.items()})
+            changed = {}
+            for (habit_id, d), completed in changes.items():
+                if previous[(habit_id, d)] != completed:
+                    changed.setdefault(habit_id, []).append((d, completed))
+            for habit_id, habit_changes in changed.items():
+                if len(habit_changes) == 1:
+                    d, completed = habit_changes[0]
+                    streaks.record_change(habit_id, d, not completed, completed)
+                else:
+                    streaks.recompute(habit_id)
+            caching.bump(user.id, caching.ENTRIES)
+            if changed:
+                # one event for the whole batch, so pages refresh once
+                events.publish(user.id, "entries", events.client_id(request), habit_ids=sorted(changed))
+    except Exception as e:
+        return JsonResponse({"error": "failed to toggle entries", "detail": str(e)}, status=500)
+
+    results = [
+        {"habit_id": habit_id, "date": d.isoformat(), "completed": completed}
+        for (habit_id, d), completed in changes.items()
+    ]
+    touched = [habits[hid] for hid in sorted(habits)]
+    compact = _wants_compact(request, data)
+    resp = {
+        "results": results,
+        "habits": payloads.month_payloads(user, today.year, today.month, habits=touched, with_streaks=True, compact=compact),
+    }
+    if compact:
+        return _compact_json(resp)
+    return JsonResponse(resp)
+
+
+@login_required
+def api_sync(request):
+    """Records changed since `?cursor=` (all records without one), up to `?limit=` per type.
+
+    Returns `habits`, `entries`, `journal`, `deleted`, the next `cursor` and
+    `has_more`; clients keep requesting with the returned cursor while
+    `has_more` is true and store the last cursor for their next sync.
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', sync.DEFAULT_LIMIT)), 1), sync.MAX_LIMIT)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "invalid limit"}, status=400)
+    try:
+        data = sync.changes(request.user, request.GET.get('cursor'), limit)
+    except sync.InvalidCursor:
+        return JsonResponse({"error": "invalid cursor"}, status=400)
+    if _wants_compact(request):
+        return _compact_json(data)
+    return JsonResponse(data)
@@ -5,6 +5,35 @@ function getCookie(name) {
   return v ? v.pop() : '';
 }
 
+// compact payloads carry completion as a bitmask: bit (day - 1) set when completed
+function expandMask(mask, ndays){
+  const days = [];
+  for(let day = 1; day <= ndays; day++){
+    days.push({day, completed: Math.floor(mask / Math.pow(2, day - 1)) % 2 === 1});
+  }
+  return days;
+}
+
+// sent with every write so this tab can skip the live events it caused itself
+const CLIENT_ID = Math.random().toString(36).slice(2);
+
+// one /api/events/ (server-sent events) connection per page; `onEvent` always
+// sees the latest render's state without reconnecting
+function useLiveEvents(onEvent){
+  const handlerRef = useRef(onEvent);
+  handlerRef.current = onEvent;
+  useEffect(()=>{
+    if(typeof EventSource === 'undefined') return;
+    const source = new EventSource('/api/events/');
+    function handle(e){
+      const event = JSON.parse(e.data);
+      if(event.client !== CLIENT_ID) handlerRef.current(event);
+    }
+    ['entry', 'entries', 'habit', 'journal'].forEach(t=> source.addEventListener(t, handle));
+    return ()=> source.close();
+  }, []);
+}
+
 function MonthPicker({year, month, onChange}){
   const years = [];
   const now = new Date();
@@ -94,13 +123,13 @@ function App({mode='dashboard'}){
   function fetchAll(){
     console.log('fetchAll start', year, month);
     // Replace local state with authoritative server response for selected month
-    fetch(`/api/habits-for-month/?year=${year}&month=${month}`).then(r=>r.json()).then(d=>{
+    fetch(`/api/habits-for-month/?year=${year}&month=${month}&format=compact`).then(r=>r.json()).then(d=>{
       const serverHabits = d.habits || [];
       setHabits(serverHabits.map(s => {
         const today = new Date();
         const todayDay = today.getDate();
 
-        let days = (s.days || []).map(sd => ({...sd}));
+        let days = expandMask(s.mask, d.ndays);
 
         // 🔥 FIX: ensure today's entry exists
         if (!days.some(d => d.day === todayDay)) {
@@ -184,6 +213,7 @@ function App({mode='dashboard'}){
         method: 'POST',
         headers: {
           'X-CSRFToken': csrftoken,
+          'X-Client-Id': CLIENT_ID,
           'Content-Type': 'application/json'
         },
         body: JSON.stringify({
@@ -209,7 +239,7 @@ function App({mode='dashboard'}){
     const csrftoken = getCookie('csrftoken');
     const res = await fetch('/add/', {
       method:'POST',
-      headers: {'X-CSRFToken': csrftoken, 'Content-Type':'application/x-www-form-urlencoded'},
+      headers: {'X-CSRFToken': csrftoken, 'X-Client-Id': CLIENT_ID, 'Content-Type':'application/x-www-form-urlencoded'},
       body: new URLSearchParams({title: title.trim()})
     });
     if(res.ok){ setNewTitle(''); fetchAll(); }
@@ -232,11 +262,19 @@ function App({mode='dashboard'}){
     });
   }, [mode, journalDate]);
 
+  // another tab or device changed something: refresh from the server, but
+  // never overwrite a journal entry that is being edited here
+  useLiveEvents(event=>{
+    if(event.type !== 'journal'){ fetchAll(); return; }
+    if(mode !== 'daily_journal' || event.date !== journalDate || journalEditing) return;
+    fetch(`/api/journal/?date=${journalDate}`).then(r=>r.json()).then(d=> setJournalText(d.text || ''));
+  });
+
   async function saveJournal(){
     const csrftoken = getCookie('csrftoken');
     const res = await fetch('/api/journal/', {
       method:'POST',
-      headers: {'X-CSRFToken': csrftoken, 'Content-Type':'application/json'},
+      headers: {'X-CSRFToken': csrftoken, 'X-Client-Id': CLIENT_ID, 'Content-Type':'application/json'},
       body: JSON.stringify({date: journalDate, text: journalText})
     });
     if(res.ok){